@@ -0,0 +1,239 @@
+"""
+assign_queries.py
+
+This module turns the open review gaps of the query status into new SME
+assignments. Each query needs at least two completed reviews with one MD or
+DO reviewer, and a third reviewer when two SMEs disagree. Open slots are
+filled from the ready SMEs with a least-loaded-first heap scheduler that
+never assigns an SME to a query twice and honors per-SME capacity.
+
+Dependencies:
+    - pandas
+"""
+
+# Third-party library
+import pandas as pd
+
+# Built-in library
+import re
+import heapq
+import logging
+import argparse
+from typing import Dict, List, Optional, Set, Tuple
+
+# Custom/User-defined module
+import main
+
+MD_CREDENTIALS = ('MD', 'DO')
+
+CONSENSUS_SME = 'EVAL-consensus'
+
+# Reviewers a query needs per review status; other statuses need no new assignment
+TARGET_REVIEWERS = {
+    'Missing SME - MD,DO': 2,
+    '1 SME review': 2,
+    '2 SMEs disagree': 3,
+    'incomplete': 2
+}
+
+# Statuses closest to completion are scheduled first
+STATUS_PRIORITY = ['Missing SME - MD,DO', '1 SME review', '2 SMEs disagree', 'incomplete']
+
+ASSIGNMENT_COLUMNS = ['Query ID', 'SME', 'Review status', 'Requires MD/DO']
+UNFILLED_COLUMNS = ['Query ID', 'Review status', 'Requires MD/DO', 'Reason']
+
+
+def setup_args() -> argparse.ArgumentParser:
+    """
+    Setup command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Assign queries to SMEs.')
+    parser.add_argument('query_status', type=str, help='Query_status.xlsx written by main.py.')
+    parser.add_argument('input_directory', type=str, help='Directory with the sme_jira_master.xlsx file.')
+    parser.add_argument('out_file', type=str, help='Excel file to write the assignments to.')
+    parser.add_argument('--capacity', type=int, default=50,
+                        help='Open assignments per SME, a Capacity column in the SME master overrides it.')
+    return parser
+
+
+def sme_list(value) -> List[str]:
+    """
+    Parse an SME list cell of the query status.
+
+    Args:
+        value: Comma separated string, list, or missing value
+
+    Returns:
+        List[str]: SME codes, empty when missing
+    """
+    if isinstance(value, (list, tuple, set)):
+        return [str(sme) for sme in value]
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return []
+    return [sme for sme in re.split(r"[\[\]',\s]+", str(value)) if sme]
+
+
+def open_slots(query_status: pd.DataFrame, md_smes: Set[str]) -> List[Tuple[int, str, str, bool, Set[str]]]:
+    """
+    Find the reviews still needed per query.
+
+    Assigned SMEs who have not reviewed yet count towards the target, and a
+    query without an MD or DO among its reviewers and pending SMEs gets one
+    slot reserved for an MD or DO.
+
+    Args:
+        query_status (pd.DataFrame): Query status with Query_ID, Review_status and SME list columns
+        md_smes (Set[str]): SMEs with MD or DO credentials
+
+    Returns:
+        List[Tuple[int, str, str, bool, Set[str]]]: (priority, query, status, requires MD/DO,
+            SMEs not eligible for the query) per open slot, in scheduling order
+    """
+    slots = []
+    for row in query_status.itertuples(index=False):
+        status = row.Review_status
+        target = TARGET_REVIEWERS.get(status)
+        if target is None:
+            continue
+        reviewed = set(sme_list(row.SMEs_reviewed)) - {CONSENSUS_SME}
+        pending = set(sme_list(row.SMEs_yet_to_review))
+        unable = set(sme_list(row.SMEs_unable_to_review))
+        covered = reviewed | pending
+
+        needed = max(target - len(covered), 0)
+        needs_md = not (covered & md_smes)
+        if needs_md:
+            needed = max(needed, 1)
+
+        priority = STATUS_PRIORITY.index(status)
+        excluded = covered | unable
+        for slot in range(needed):
+            slots.append((priority, row.Query_ID, status, needs_md and slot == 0, excluded))
+
+    # MD or DO slots first since those reviewers are scarce, then by status priority
+    slots.sort(key=lambda slot: (not slot[3], slot[0]))
+    return slots
+
+
+class LoadHeap:
+    """
+    Min-heap of SMEs by open assignment count.
+
+    Entries are never updated in place; a load change pushes a new entry and
+    entries whose load is outdated are dropped when they reach the top.
+    """
+
+    def __init__(self, smes: List[str], load: Dict[str, int]):
+        self._load = load
+        self._heap = [(load[sme], order, sme) for order, sme in enumerate(smes)]
+        self._order = {sme: order for order, sme in enumerate(smes)}
+        heapq.heapify(self._heap)
+
+    def push(self, sme: str):
+        heapq.heappush(self._heap, (self._load[sme], self._order[sme], sme))
+
+    def pop_eligible(self, excluded: Set[str], capacity: Dict[str, int]) -> Optional[str]:
+        """
+        Remove and return the least loaded SME with free capacity that is not excluded.
+        """
+        skipped = []
+        chosen = None
+        while self._heap:
+            load, order, sme = heapq.heappop(self._heap)
+            if load != self._load[sme] or load >= capacity[sme]:
+                # Outdated entry, or SME at capacity for good
+                continue
+            if sme in excluded:
+                skipped.append((load, order, sme))
+                continue
+            chosen = sme
+            break
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+        return chosen
+
+
+def assign_queries(query_status: pd.DataFrame, sme_ready: pd.DataFrame,
+                   default_capacity: int = 50) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Assign the open review slots to ready SMEs.
+
+    Args:
+        query_status (pd.DataFrame): Query status from generate_query_status or Query_status.xlsx
+        sme_ready (pd.DataFrame): Ready SMEs from load_sme_master_list
+        default_capacity (int): Open assignments per SME when the master has no Capacity column
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]: (assignments, unfilled slots, SME load)
+    """
+    smes = [str(sme) for sme in sme_ready['ID']]
+    credentials = sme_ready['Please specify your clinical credentials'].astype(str).str.strip()
+    md_smes = {sme for sme, credential in zip(smes, credentials) if credential in MD_CREDENTIALS}
+    if 'Capacity' in sme_ready:
+        capacity = {sme: int(value) if pd.notna(value) else default_capacity
+                    for sme, value in zip(smes, sme_ready['Capacity'])}
+    else:
+        capacity = {sme: default_capacity for sme in smes}
+
+    status = query_status.rename(columns={'Query ID': 'Query_ID', 'Review status': 'Review_status'})
+    slots = open_slots(status, md_smes)
+
+    # Pending assignments already count against capacity
+    load = {sme: 0 for sme in smes}
+    for pending in status['SMEs_yet_to_review']:
+        for sme in sme_list(pending):
+            if sme in load:
+                load[sme] += 1
+    initial_load = dict(load)
+
+    md_heap = LoadHeap([sme for sme in smes if sme in md_smes], load)
+    any_heap = LoadHeap(smes, load)
+
+    assignments = []
+    unfilled = []
+    assigned: Dict[str, Set[str]] = {}
+    for _, query, review_status, needs_md, excluded in slots:
+        taken = excluded | assigned.get(query, set())
+        heap = md_heap if needs_md else any_heap
+        sme = heap.pop_eligible(taken, capacity)
+        if sme is None:
+            reason = 'no MD/DO SME with free capacity' if needs_md else 'no SME with free capacity'
+            unfilled.append([query, review_status, needs_md, reason])
+            continue
+        load[sme] += 1
+        assigned.setdefault(query, set()).add(sme)
+        assignments.append([query, sme, review_status, needs_md])
+        if sme in md_smes:
+            md_heap.push(sme)
+        any_heap.push(sme)
+
+    sme_load = pd.DataFrame({
+        'SME': smes,
+        'MD/DO': [sme in md_smes for sme in smes],
+        'Capacity': [capacity[sme] for sme in smes],
+        'Pending': [initial_load[sme] for sme in smes],
+        'New': [load[sme] - initial_load[sme] for sme in smes],
+        'Total': [load[sme] for sme in smes]
+    })
+    return (pd.DataFrame(assignments, columns=ASSIGNMENT_COLUMNS),
+            pd.DataFrame(unfilled, columns=UNFILLED_COLUMNS),
+            sme_load)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = setup_args()
+    args = parser.parse_args()
+
+    sme_ready, _ = main.load_sme_master_list(args.input_directory)
+    if sme_ready is None:
+        logging.error("Failed to load SME master list")
+        exit(1)
+    query_status = pd.read_excel(args.query_status)
+
+    assignments, unfilled, sme_load = assign_queries(query_status, sme_ready, args.capacity)
+    with pd.ExcelWriter(args.out_file) as writer:
+        assignments.to_excel(writer, sheet_name='Assignments', index=False)
+        unfilled.to_excel(writer, sheet_name='Unfilled', index=False)
+        sme_load.to_excel(writer, sheet_name='SME load', index=False)
+    logging.info('Assigned %d slots, %d left unfilled', len(assignments), len(unfilled))
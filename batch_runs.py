@@ -0,0 +1,229 @@
+"""
+batch_runs.py
+
+Evaluate several model response runs against the same publication query set.
+The SME workbooks, SME master and publication list are ingested once and the
+review status is computed once; each run, given by its own
+query_output-<run>.xlsx and query_output-<run>-failed.xlsx files, then gets
+its query responses, query status, transformed file and stats in parallel.
+Each run writes its deliverables to out_directory/<run>, and comparison.xlsx
+puts the runs side by side.
+
+Dependencies:
+    - pandas
+"""
+
+# Built-in library
+import os
+import re
+import logging
+import argparse
+from os import makedirs
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+# Custom/User-defined module
+import main
+import generate_datafiles
+import generate_aggregateScore
+import output_writer
+import latency_analytics
+
+# Third-party library
+import pandas as pd
+
+RUN_PATTERN = re.compile(r'^query_output-(?P<run>.+)\.xlsx$')
+
+# Shared frames a run worker needs, the only ones pickled to it
+RUN_INPUTS = ['publication', 'review_status', 'data']
+
+
+def setup_args() -> argparse.ArgumentParser:
+    """
+    Setup command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Evaluate several model response runs with shared feedback.')
+    parser.add_argument('feedback_directory', type=str, help='Directory with feedback and disagreement data.')
+    parser.add_argument(
+        'input_directory',
+        type=str,
+        help='Directory with input data queries_metadata,publication file,query_output-<run> and sme_master data.'
+    )
+    parser.add_argument('out_directory', type=str, help='Directory to store the per-run directories and comparison')
+    parser.add_argument('--runs', type=str, nargs='+', default=None,
+                        help='Runs to evaluate, all query_output-<run>.xlsx files of input_directory by default.')
+    parser.add_argument('--workers', type=int, default=4, help='Number of runs evaluated in parallel.')
+    parser.add_argument('--skip-validation', action='store_true',
+                        help='Do not stop on feedback validation issues (missing columns, unknown scores or SMEs, duplicates).')
+    return parser
+
+
+def discover_runs(input_directory: str) -> List[str]:
+    """
+    Find the model response runs of an input directory.
+
+    Args:
+        input_directory (str): Directory containing query_output-<run>.xlsx files
+
+    Returns:
+        List[str]: Sorted run names, failed output files excluded
+    """
+    runs = []
+    for name in os.listdir(input_directory):
+        match = RUN_PATTERN.match(name)
+        if match and not match.group('run').endswith('-failed'):
+            runs.append(match.group('run'))
+    return sorted(runs)
+
+
+def evaluate_run(run: str, input_directory: str, out_directory: str, shared: dict) -> dict:
+    """
+    Evaluate one model response run and write its deliverables, run in a worker process.
+
+    Queries whose response failed in the run, or that the run did not answer,
+    are left out of its review status since the SME ratings are not about a
+    response of this run. Query_status, the transformed file and stats all
+    use that filtered review status, so failed queries show their failed
+    response status instead of the SME review status. A deliverable that
+    fails to write fails the run once the other deliverables are written.
+
+    Args:
+        run (str): Run name
+        input_directory (str): Directory containing the run's query output files
+        out_directory (str): Directory of the run's deliverables
+        shared (dict): RUN_INPUTS frames of main.load_shared_inputs
+
+    Returns:
+        dict: query_status and stats frames and LatencyStats of the run
+    """
+    publication = shared['publication']
+    query_feedback, query_reference, query_failed = main.load_query_output(input_directory, run)
+    query_output, query_reference = generate_datafiles.generate_queryResponse_reference(
+        query_feedback, query_reference, publication, query_failed)
+
+    answered = list(query_output.loc[query_output['Status'] == 'Success', 'Query ID'])
+    review_status = shared['review_status']
+    review_status = review_status[review_status['Query ID'].isin(answered)]
+
+    query_status = generate_datafiles.generate_query_status(review_status, query_output, publication)
+    transform_df = generate_datafiles.generate_transformed_file(shared['data'], review_status)
+    stats_df = generate_aggregateScore.generate_CIScore(transform_df)
+
+    makedirs(out_directory, exist_ok=True)
+    latency = latency_analytics.latency_stats(query_output, publication)
+    # Written inline, the runs themselves are the parallel unit
+    with output_writer.OutputStage(0) as outputs:
+        outputs.excel_streaming(os.path.join(out_directory, 'Query_response.xlsx'), {
+            'Feedback': query_output,
+            'References': query_reference
+        })
+        outputs.excel(query_status, os.path.join(out_directory, 'Query_status.xlsx'))
+        outputs.excel(transform_df, os.path.join(out_directory, 'transformed.xlsx'))
+        outputs.excel(stats_df, os.path.join(out_directory, 'stats.xlsx'))
+        outputs.excel_streaming(os.path.join(out_directory, 'latency.xlsx'), latency.tables())
+        outputs.text(latency.to_json(), os.path.join(out_directory, 'latency_sketches.json'))
+    if outputs.failures:
+        raise RuntimeError('; '.join(f'failed to write {label}: {error}' for label, error in outputs.failures))
+    return {'query_status': query_status, 'stats': stats_df, 'latency': latency}
+
+
+def comparison_tables(results: Dict[str, dict]) -> Dict[str, pd.DataFrame]:
+    """
+    Put the stats and review status counts of the runs side by side.
+
+    Args:
+        results (Dict[str, dict]): Frames returned by evaluate_run, keyed by run name
+
+    Returns:
+        Dict[str, pd.DataFrame]: 'Scores' with n, percentage and confidence interval per run,
+            'Review status' with the number of queries per status and run
+    """
+    keys = ['metric', 'collapsed_score', 'reported_value']
+    scores = []
+    status_counts = {}
+    for run, frames in results.items():
+        stats_df = frames['stats']
+        if stats_df is not None and not stats_df.empty:
+            run_scores = stats_df[keys + ['n', 'percentage', 'confidence_interval_lower',
+                                          'confidence_interval_upper']]
+            run_scores = run_scores.rename(columns={
+                'n': f'{run}_n',
+                'percentage': f'{run}_percentage',
+                'confidence_interval_lower': f'{run}_ci_lower',
+                'confidence_interval_upper': f'{run}_ci_upper'
+            })
+            scores.append(run_scores.set_index(keys))
+        if frames['query_status'] is not None:
+            status_counts[run] = frames['query_status']['Review status'].astype(str).value_counts()
+
+    status = pd.DataFrame(status_counts).fillna(0).astype(int).rename_axis('Review status').reset_index()
+    return {
+        'Scores': pd.concat(scores, axis=1).reset_index() if scores else pd.DataFrame(columns=keys),
+        'Review status': status
+    }
+
+
+def run_batch(feedback_directory: str, input_directory: str, out_directory: str,
+              runs: Optional[List[str]] = None, workers: int = 4, validate: bool = True) -> Dict[str, dict]:
+    """
+    Evaluate the runs against the shared inputs and write the comparison table.
+
+    Args:
+        feedback_directory (str): Directory with the SME feedback workbooks
+        input_directory (str): Directory containing the input files
+        out_directory (str): Directory of the per-run directories and comparison.xlsx
+        runs (Optional[List[str]]): Runs to evaluate, all discovered runs by default
+        workers (int): Number of runs evaluated in parallel
+        validate (bool): Stop before any run when the feedback fails validation
+
+    Returns:
+        Dict[str, dict]: Frames returned by evaluate_run for each run that succeeded
+    """
+    runs = runs or discover_runs(input_directory)
+    if not runs:
+        raise ValueError(f"No query_output-<run>.xlsx files found in {input_directory}")
+    makedirs(out_directory, exist_ok=True)
+    shared = main.load_shared_inputs(feedback_directory, input_directory, validate,
+                                     os.path.join(out_directory, 'validation_issues.xlsx'))
+    if shared is None:
+        raise RuntimeError("Failed to load or validate the shared inputs")
+
+    metadata = generate_datafiles.generate_publicationMetadata(shared['publication'])
+    output_writer.write_excel(metadata, os.path.join(out_directory, 'Query_metadata.xlsx'))
+    full_feedback = generate_datafiles.get_full_feedback(shared['cleaned_feedback'], shared['publication'])
+    output_writer.write_excel_streaming(os.path.join(out_directory, 'All_results.xlsx'), full_feedback)
+
+    run_inputs = {name: shared[name] for name in RUN_INPUTS}
+    results = {}
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(runs)))) as executor:
+        futures = {
+            run: executor.submit(evaluate_run, run, input_directory, os.path.join(out_directory, run), run_inputs)
+            for run in runs
+        }
+        for run, future in futures.items():
+            try:
+                results[run] = future.result()
+                logging.info('Evaluated run %s', run)
+            except Exception as e:
+                logging.error('Failed to evaluate run %s: %s', run, e)
+
+    output_writer.write_excel_streaming(os.path.join(out_directory, 'comparison.xlsx'), comparison_tables(results))
+
+    # Latency of all runs pooled, merged from the per-run sketches
+    latency = latency_analytics.LatencyStats()
+    for frames in results.values():
+        latency.merge(frames['latency'])
+    output_writer.write_excel_streaming(os.path.join(out_directory, 'latency.xlsx'), latency.tables())
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = setup_args()
+    args = parser.parse_args()
+
+    runs = args.runs or discover_runs(args.input_directory)
+    results = run_batch(args.feedback_directory, args.input_directory, args.out_directory, runs, args.workers,
+                        not args.skip_validation)
+    if len(results) < len(runs):
+        exit(1)
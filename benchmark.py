@@ -0,0 +1,361 @@
+"""
+benchmark.py
+
+Stage-level benchmark suite for the feedback pipeline.
+Runs each public pipeline function on synthetic frames at several sizes,
+stores the timings in a machine-readable baseline file and flags
+regressions against a previous baseline. A memory mode compares the peak
+memory of the feedback conversion against the previous two-conversion flow.
+
+Dependencies:
+    - pandas
+    - numpy
+"""
+
+# Built-in library
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+# Custom/User-defined module
+import main
+import feedback_data
+import process_query
+import generate_datafiles
+import generate_aggregateScore
+import generate_synthetic_data
+import dtype_policy
+
+# Third-party library
+import pandas as pd
+import numpy as np
+
+STAGES = [
+    'load_raw_feedback',
+    'convert_to_dimensionscore',
+    'get_review_status',
+    'generate_transformed_file',
+    'generate_query_status',
+    'generate_CIScore'
+]
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+
+def setup_args() -> argparse.ArgumentParser:
+    """
+    Setup command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the feedback pipeline stages.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Number of queries per benchmark size.')
+    parser.add_argument('--stages', type=str, nargs='+', default=STAGES, choices=STAGES,
+                        help='Stages to benchmark.')
+    parser.add_argument('--repeats', type=int, default=3, help='Timed repeats per stage and size.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic corpus.')
+    parser.add_argument('--max-seconds', type=float, default=600.0,
+                        help='Skip larger sizes of a stage once one run exceeds this time.')
+    parser.add_argument('--save', type=str, default=None, help='Write results to this baseline file.')
+    parser.add_argument('--compare', type=str, default=None, help='Baseline file to compare against.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative slowdown that counts as a regression (0.2 = 20%%).')
+    parser.add_argument('--memory', type=int, default=None, metavar='QUERIES',
+                        help='Only compare peak conversion memory of the old and new flow at this size.')
+    return parser
+
+
+def smes_for_size(n_queries: int) -> int:
+    """
+    Scale the SME pool with the number of queries, from 10 up to 200 SMEs.
+    """
+    return int(min(200, max(10, n_queries // 500)))
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    Silence the progress prints of the pipeline functions while timing them.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def time_call(func: Callable, setup: Callable, repeats: int) -> Dict[str, float]:
+    """
+    Time a call, rebuilding its arguments before every repeat.
+
+    Args:
+        func (Callable): Function to time, called with the arguments from setup
+        setup (Callable): Returns a tuple of fresh arguments, not timed
+        repeats (int): Number of timed repeats
+
+    Returns:
+        Dict[str, float]: Median, minimum and maximum wall time in seconds
+    """
+    timings = []
+    for _ in range(repeats):
+        call_args = setup()
+        with quiet():
+            start = time.perf_counter()
+            func(*call_args)
+            timings.append(time.perf_counter() - start)
+    return {
+        'seconds': float(np.median(timings)),
+        'min_seconds': float(min(timings)),
+        'max_seconds': float(max(timings)),
+        'repeats': repeats
+    }
+
+
+def prepare_inputs(n_queries: int, seed: int, workdir: str, with_workbooks: bool) -> Dict[str, object]:
+    """
+    Build the synthetic inputs of every stage for one benchmark size.
+
+    Args:
+        n_queries (int): Number of queries
+        seed (int): Seed for the synthetic corpus
+        workdir (str): Scratch directory for the generated files
+        with_workbooks (bool): Write feedback workbooks for load_raw_feedback
+
+    Returns:
+        Dict[str, object]: Stage inputs keyed by name
+    """
+    corpus = generate_synthetic_data.build_corpus(n_queries=n_queries, n_smes=smes_for_size(n_queries), seed=seed)
+    input_directory = os.path.join(workdir, 'input')
+    feedback_directory = os.path.join(workdir, 'feedback')
+    os.makedirs(input_directory, exist_ok=True)
+    corpus['sme_master'].to_excel(os.path.join(input_directory, 'sme_jira_master.xlsx'), index=False)
+
+    inputs = {'corpus': corpus, 'xlsm_files': []}
+    if with_workbooks:
+        inputs['xlsm_files'] = generate_synthetic_data.write_feedback_workbooks(
+            corpus['feedback'], corpus['references'], feedback_directory)
+
+    # Stage inputs carry the load-time dtypes of main.py
+    dtype_policy.reset_categories()
+    frames = {name: dtype_policy.apply_dtype_policy(corpus[name])
+              for name in ('feedback', 'publication', 'query_output', 'query_output_references', 'query_failed')}
+
+    with quiet():
+        sme_ready, _ = main.load_sme_master_list(input_directory)
+        publication = frames['publication']
+        feedback = frames['feedback']
+        feedback = feedback[feedback['Query ID'].isin(list(publication['query_id']))]
+        raw_review = feedback_data.get_reviewed_queries(feedback)
+        review = feedback_data.convert_to_dimensionscore(raw_review)
+        cleaned_feedback = feedback_data.convert_to_dimensionscore(feedback)
+        review_status, data = process_query.get_review_status(review.copy(), sme_ready, cleaned_feedback)
+        transform_df = generate_datafiles.generate_transformed_file(data, review_status)
+        query_feedback, _ = generate_datafiles.generate_queryResponse_reference(
+            frames['query_output'], frames['query_output_references'], publication, frames['query_failed'])
+
+    inputs.update({
+        'sme_ready': sme_ready,
+        'publication': publication,
+        'feedback': feedback,
+        'review': review,
+        'cleaned_feedback': cleaned_feedback,
+        'review_status': review_status,
+        'data': data,
+        'transform_df': transform_df,
+        'query_feedback': query_feedback
+    })
+    return inputs
+
+
+def stage_calls(inputs: Dict[str, object]) -> Dict[str, tuple]:
+    """
+    Map each stage to the function under test and a setup returning its arguments.
+    """
+    return {
+        'load_raw_feedback': (
+            feedback_data.load_raw_feedback,
+            lambda: (inputs['xlsm_files'],)),
+        'convert_to_dimensionscore': (
+            feedback_data.convert_to_dimensionscore,
+            lambda: (inputs['feedback'],)),
+        'get_review_status': (
+            process_query.get_review_status,
+            lambda: (inputs['review'].copy(), inputs['sme_ready'], inputs['cleaned_feedback'])),
+        'generate_transformed_file': (
+            generate_datafiles.generate_transformed_file,
+            lambda: (inputs['data'], inputs['review_status'])),
+        'generate_query_status': (
+            generate_datafiles.generate_query_status,
+            lambda: (inputs['review_status'], inputs['query_feedback'], inputs['publication'])),
+        'generate_CIScore': (
+            generate_aggregateScore.generate_CIScore,
+            lambda: (inputs['transform_df'],))
+    }
+
+
+def run_benchmarks(sizes: List[int], stages: List[str], repeats: int = 3,
+                   seed: int = 0, max_seconds: float = 600.0) -> Dict[str, object]:
+    """
+    Run the selected stages at every size.
+
+    Args:
+        sizes (List[int]): Number of queries per size
+        stages (List[str]): Stages to benchmark
+        repeats (int): Timed repeats per stage and size
+        seed (int): Seed for the synthetic corpus
+        max_seconds (float): Skip larger sizes of a stage once one run exceeds this time
+
+    Returns:
+        Dict[str, object]: Baseline document with metadata and per stage results
+    """
+    results = {}
+    too_slow = set()
+    for size in sorted(sizes):
+        with tempfile.TemporaryDirectory() as workdir:
+            print(f"Preparing synthetic inputs for {size} queries")
+            inputs = prepare_inputs(size, seed, workdir, 'load_raw_feedback' in stages)
+            calls = stage_calls(inputs)
+            for stage in stages:
+                key = f'{stage}@{size}'
+                if stage in too_slow:
+                    results[key] = {'stage': stage, 'size': size, 'skipped': True}
+                    print(f"{key:<40} skipped")
+                    continue
+                func, setup = calls[stage]
+                timing = time_call(func, setup, repeats if size < 100000 else 1)
+                results[key] = dict(stage=stage, size=size, rows=len(inputs['feedback']), **timing)
+                print(f"{key:<40} {timing['seconds']:10.3f}s")
+                if timing['max_seconds'] > max_seconds:
+                    too_slow.add(stage)
+
+    return {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'seed': seed
+        },
+        'results': results
+    }
+
+
+def compare_results(current: Dict[str, object], baseline: Dict[str, object], threshold: float) -> pd.DataFrame:
+    """
+    Compare benchmark results against a baseline.
+
+    Args:
+        current (Dict[str, object]): Results of this run
+        baseline (Dict[str, object]): Previously saved results
+        threshold (float): Relative slowdown that counts as a regression
+
+    Returns:
+        pd.DataFrame: One row per stage and size present in both runs
+    """
+    rows = []
+    for key, result in current['results'].items():
+        base = baseline['results'].get(key)
+        if base is None or result.get('skipped') or base.get('skipped'):
+            continue
+        ratio = result['seconds'] / base['seconds'] if base['seconds'] > 0 else np.inf
+        rows.append({
+            'benchmark': key,
+            'baseline_seconds': round(base['seconds'], 4),
+            'current_seconds': round(result['seconds'], 4),
+            'ratio': round(ratio, 3),
+            'regression': ratio > 1 + threshold
+        })
+    return pd.DataFrame(rows, columns=['benchmark', 'baseline_seconds', 'current_seconds', 'ratio', 'regression'])
+
+
+def legacy_conversion_flow(feedback: pd.DataFrame):
+    """
+    Previous main.py flow: filter the reviewed and unable frames, convert the
+    reviewed subset and the full feedback separately with deep copies, then
+    collapse the reviewed scores.
+    """
+    unable = feedback_data.get_unable_to_review_queries(feedback)
+    raw_review = feedback_data.get_reviewed_queries(feedback)
+    review = feedback_data.convert_to_dimensionscore(raw_review.copy())
+    cleaned_feedback = feedback_data.convert_to_dimensionscore(feedback.copy())
+    data = process_query.collapsed_score(review)
+    return unable, raw_review, review, cleaned_feedback, data
+
+
+def masked_conversion_flow(feedback: pd.DataFrame):
+    """
+    Current main.py flow: convert once and derive the subsets by mask.
+    """
+    cleaned_feedback, review, review_mask, unable_mask = main.convert_feedback(feedback)
+    data = process_query.collapsed_score(review)
+    return cleaned_feedback, review, review_mask, unable_mask, data
+
+
+def peak_memory(func: Callable, *args) -> int:
+    """
+    Peak traced memory in bytes allocated while running func, results included.
+    """
+    tracemalloc.start()
+    try:
+        with quiet():
+            result = func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak
+
+
+def compare_pipeline_memory(n_queries: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Compare the peak memory of the old and new feedback conversion flow.
+
+    Args:
+        n_queries (int): Number of queries of the synthetic corpus
+        seed (int): Seed for the synthetic corpus
+
+    Returns:
+        pd.DataFrame: Peak MiB of each flow on the same feedback frame
+    """
+    corpus = generate_synthetic_data.build_corpus(n_queries=n_queries, n_smes=smes_for_size(n_queries), seed=seed)
+    feedback = corpus['feedback']
+    rows = []
+    for name, flow in [('legacy', legacy_conversion_flow), ('masked', masked_conversion_flow)]:
+        peak = peak_memory(flow, feedback)
+        rows.append({'flow': name, 'queries': n_queries, 'rows': len(feedback),
+                     'peak_mib': round(peak / 2 ** 20, 2)})
+    result = pd.DataFrame(rows)
+    result['relative'] = (result['peak_mib'] / result['peak_mib'].iloc[0]).round(3)
+    return result
+
+
+if __name__ == "__main__":
+    parser = setup_args()
+    args = parser.parse_args()
+
+    if args.memory:
+        print(compare_pipeline_memory(args.memory, args.seed).to_string(index=False))
+        sys.exit(0)
+
+    current = run_benchmarks(args.sizes, args.stages, args.repeats, args.seed, args.max_seconds)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+        print(f"Saved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        comparison = compare_results(current, baseline, args.threshold)
+        print(comparison.to_string(index=False))
+        if comparison['regression'].any():
+            print(f"Regression above {args.threshold:.0%} in: "
+                  f"{', '.join(comparison[comparison['regression']]['benchmark'])}")
+            sys.exit(1)
@@ -0,0 +1,200 @@
+"""
+calibration.py
+
+This module reports how each SME rates against the final score chosen for a
+query in generate_transformed_file (email consensus, the mode of three
+raters, or the first rater of a pair). For every SME and dimension it builds
+a confusion matrix of SME rating by final score and a bias score, the mean
+signed distance to the final score oriented so that a positive bias means
+softer (more favorable) and a negative bias harsher ratings.
+
+Ratings and final scores are integer coded once and all confusion matrices
+come from a single bincount over the combined (SME, dimension, rating, final)
+code; bias and agreement are then reductions of the matrices, so there is no
+loop over SMEs or queries.
+
+Dependencies:
+    - pandas
+    - numpy
+"""
+
+# Third-party library
+import pandas as pd
+import numpy as np
+
+# Built-in library
+import logging
+import argparse
+from typing import Dict, Tuple
+
+# Custom/User-defined module
+import main
+import feedback_data
+import generate_datafiles
+
+DIMENSIONS = feedback_data.DIMENSION_COLUMNS
+
+# transformed file column holding the final score of each dimension
+FINAL_COLUMNS = {
+    'Overall Answer Helpfulness': 'overall_final',
+    'Comprehension': 'comprehension_final',
+    'Correctness': 'correctness_final',
+    'Completeness': 'completeness_final',
+    'Clinical Harmfulness': 'harmfulness_final',
+    'Clinical Harmfulness Level': 'harmful_level_final'
+}
+
+# +1 when a higher score is more favorable; Clinical Harmfulness 1 means any harm
+FAVORABLE_DIRECTION = {
+    'Overall Answer Helpfulness': 1,
+    'Comprehension': 1,
+    'Correctness': 1,
+    'Completeness': 1,
+    'Clinical Harmfulness': -1,
+    'Clinical Harmfulness Level': 1
+}
+
+# Cell values that mean no rating
+MISSING_VALUES = ['nan', 'None', '']
+
+CONSENSUS_SME = 'EVAL-consensus'
+
+SUMMARY_COLUMNS = ['SME', 'dimension', 'n', 'agreement', 'bias', 'bias_z', 'softer', 'harsher']
+CONFUSION_COLUMNS = ['SME', 'dimension', 'rating', 'final', 'count']
+
+
+def setup_args() -> argparse.ArgumentParser:
+    """
+    Setup command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Per-SME calibration against the final scores.')
+    parser.add_argument('feedback_directory', type=str, help='Directory with feedback and disagreement data.')
+    parser.add_argument('input_directory', type=str, help='Directory with the Publication.xlsx and SME master files.')
+    parser.add_argument('out_file', type=str, help='Excel file to write the calibration report to.')
+    return parser
+
+
+def load_ratings_and_finals(feedback_directory: str, input_directory: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Load the reviewed ratings and the transformed file they are reduced to.
+
+    Args:
+        feedback_directory (str): Directory with the SME feedback workbooks
+        input_directory (str): Directory containing the input files
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: (reviewed ratings as passed to generate_transformed_file,
+            transformed file)
+    """
+    shared = main.load_shared_inputs(feedback_directory, input_directory)
+    if shared is None:
+        raise RuntimeError("Failed to load the feedback and SME master list")
+    transformed = generate_datafiles.generate_transformed_file(shared['data'], shared['review_status'])
+    if transformed is None:
+        raise RuntimeError("Failed to generate the transformed file")
+    return shared['data'], transformed
+
+
+def category_codes(ratings: pd.DataFrame, finals: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, pd.Index]:
+    """
+    Integer code the ratings and final scores of all dimensions with one shared vocabulary.
+
+    Args:
+        ratings (pd.DataFrame): Ratings aligned to finals, one column per dimension
+        finals (pd.DataFrame): Final scores aligned to ratings, one column per dimension
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, pd.Index]: (rating codes, final codes, categories); both code
+            arrays are rows by dimensions with -1 where missing
+    """
+    values = np.concatenate([ratings[DIMENSIONS].astype(str).to_numpy().ravel(),
+                             finals[DIMENSIONS].astype(str).to_numpy().ravel()])
+    values = pd.Series(values)
+    codes, categories = pd.factorize(values.where(~values.isin(MISSING_VALUES)), sort=True)
+    codes = codes.reshape(2, len(ratings), len(DIMENSIONS))
+    return codes[0], codes[1], pd.Index(categories)
+
+
+def calibration_tables(ratings: pd.DataFrame, transformed: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Build the confusion matrices and bias of every SME and dimension against the final scores.
+
+    Args:
+        ratings (pd.DataFrame): Reviewed ratings with SME, Query ID and dimension columns
+        transformed (pd.DataFrame): Transformed file from generate_transformed_file
+
+    Returns:
+        Dict[str, pd.DataFrame]: 'Calibration' with n, agreement, bias, its z-score across SMEs and the
+            share of softer and harsher ratings per SME and dimension, 'Confusion' with the non-empty
+            cells of the confusion matrices
+    """
+    # Queries without a final score ('unknown' status) carry placeholders only
+    transformed = transformed[transformed['qa_review_status'] != 'unknown']
+    finals = transformed[list(FINAL_COLUMNS.values())]
+    finals.columns = list(FINAL_COLUMNS)
+
+    ratings = ratings[ratings['SME'] != CONSENSUS_SME]
+    query_rows = pd.Index(transformed['Query ID']).get_indexer(ratings['Query ID'])
+    ratings = ratings[query_rows >= 0]
+    finals = finals.iloc[query_rows[query_rows >= 0]]
+
+    sme_codes, smes = pd.factorize(ratings['SME'].astype(str), sort=True)
+    rating_codes, final_codes, categories = category_codes(ratings, finals)
+    n_smes, n_dims, k = len(smes), len(DIMENSIONS), len(categories)
+
+    # One bincount over (SME, dimension, rating, final) gives every confusion matrix
+    dimension_codes = np.broadcast_to(np.arange(n_dims), rating_codes.shape)
+    rated = (rating_codes >= 0) & (final_codes >= 0)
+    combined = ((np.broadcast_to(sme_codes[:, None], rating_codes.shape) * n_dims + dimension_codes) * k
+                + rating_codes) * k + final_codes
+    confusion = np.bincount(combined[rated], minlength=n_smes * n_dims * k * k).reshape(n_smes, n_dims, k, k)
+
+    # Signed score distance of each (rating, final) cell, NaN when either is not numeric
+    scores = pd.to_numeric(pd.Series(categories), errors='coerce').to_numpy(dtype=float)
+    direction = np.array([FAVORABLE_DIRECTION[dimension] for dimension in DIMENSIONS], dtype=float)
+    distance = direction[:, None, None] * (scores[:, None] - scores[None, :])[None, :, :]
+    numeric = ~np.isnan(distance)
+
+    n = confusion.sum(axis=(2, 3))
+    n_numeric = (confusion * numeric).sum(axis=(2, 3))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        agreement = np.trace(confusion, axis1=2, axis2=3) / n
+        bias = (confusion * np.nan_to_num(distance)).sum(axis=(2, 3)) / n_numeric
+        softer = (confusion * (distance > 0)).sum(axis=(2, 3)) / n_numeric
+        harsher = (confusion * (distance < 0)).sum(axis=(2, 3)) / n_numeric
+        bias_z = (bias - np.nanmean(bias, axis=0)) / np.nanstd(bias, axis=0)
+
+    summary = pd.DataFrame({
+        'SME': np.repeat(np.asarray(smes), n_dims),
+        'dimension': np.tile(DIMENSIONS, n_smes),
+        'n': n.ravel(),
+        'agreement': agreement.ravel(),
+        'bias': bias.ravel(),
+        'bias_z': bias_z.ravel(),
+        'softer': softer.ravel(),
+        'harsher': harsher.ravel()
+    }, columns=SUMMARY_COLUMNS)
+    summary = summary[summary['n'] > 0].round(4).reset_index(drop=True)
+
+    sme_index, dimension_index, rating_index, final_index = np.nonzero(confusion)
+    cells = pd.DataFrame({
+        'SME': np.asarray(smes)[sme_index],
+        'dimension': np.asarray(DIMENSIONS)[dimension_index],
+        'rating': np.asarray(categories)[rating_index],
+        'final': np.asarray(categories)[final_index],
+        'count': confusion[sme_index, dimension_index, rating_index, final_index]
+    }, columns=CONFUSION_COLUMNS)
+    return {'Calibration': summary, 'Confusion': cells}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = setup_args()
+    args = parser.parse_args()
+
+    ratings, transformed = load_ratings_and_finals(args.feedback_directory, args.input_directory)
+    tables = calibration_tables(ratings, transformed)
+    with pd.ExcelWriter(args.out_file) as writer:
+        for sheet, frame in tables.items():
+            frame.to_excel(writer, sheet_name=sheet, index=False)
+    logging.info('Wrote calibration of %d SMEs to %s', tables['Calibration']['SME'].nunique(), args.out_file)
@@ -0,0 +1,220 @@
+"""
+dtype_policy.py
+
+This module defines the compact dtypes used for all pipeline frames.
+ID and code columns become categoricals whose categories are shared
+across frames, so joins and isin filters run on integer codes, and free
+text columns become a compact string type.
+
+Dependencies:
+    - pandas
+    - numpy
+    - pyarrow (optional, for Arrow-backed strings)
+"""
+
+# Third-party libraries
+import pandas as pd
+import numpy as np
+
+# Built-in libraries
+from typing import Callable, Dict, List, Optional
+
+# Columns stored as categoricals, mapped to the group whose categories they share
+CATEGORY_GROUPS = {
+    'Query ID': 'query_id',
+    'query_id': 'query_id',
+    'SME': 'sme',
+    'Status': 'status',
+    'Unable to Review': 'unable_to_review',
+    'Overall Answer Helpfulness': 'Overall Answer Helpfulness',
+    'Comprehension': 'Comprehension',
+    'Correctness': 'Correctness',
+    'Completeness': 'Completeness',
+    'Clinical Harmfulness': 'Clinical Harmfulness',
+    'Clinical Harmfulness Level': 'Clinical Harmfulness Level'
+}
+
+# Free text columns stored with the compact string type
+TEXT_COLUMNS = [
+    'Query',
+    'query',
+    'Processed Query',
+    'Response',
+    'Response URL',
+    'Additional Information',
+    'Notes'
+]
+
+# Categories per group, append-only so codes of earlier frames stay valid
+_shared_categories: Dict[str, pd.Index] = {}
+
+
+def text_dtype() -> pd.StringDtype:
+    """
+    Compact string dtype, Arrow-backed when pyarrow is installed.
+    """
+    try:
+        import pyarrow  # noqa: F401
+        return pd.StringDtype('pyarrow')
+    except ImportError:
+        return pd.StringDtype('python')
+
+
+def shared_categories(group: str) -> pd.Index:
+    """
+    Current categories of a group.
+
+    Args:
+        group (str): Category group name
+
+    Returns:
+        pd.Index: Categories registered so far, empty if none
+    """
+    return _shared_categories.get(group, pd.Index([], dtype=object))
+
+
+def register_categories(group: str, values) -> pd.Index:
+    """
+    Add unseen values to the categories of a group.
+
+    Args:
+        group (str): Category group name
+        values: Values to register, missing values are ignored
+
+    Returns:
+        pd.Index: Updated categories of the group
+    """
+    current = shared_categories(group)
+    if isinstance(values, pd.Series) and isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.cat.categories
+    uniques = pd.Index(pd.unique(pd.Series(values, dtype=object).dropna()), dtype=object)
+    new = uniques.difference(current, sort=False)
+    if len(new):
+        current = current.append(new)
+        _shared_categories[group] = current
+    return current
+
+
+def reset_categories():
+    """
+    Forget every registered category, for independent runs in one process.
+    """
+    _shared_categories.clear()
+
+
+def to_shared_categorical(series: pd.Series, group: str) -> pd.Series:
+    """
+    Convert a column to a categorical over the shared categories of its group.
+
+    Args:
+        series (pd.Series): Column to convert
+        group (str): Category group name
+
+    Returns:
+        pd.Series: Categorical column
+    """
+    categories = register_categories(group, series)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.set_categories(categories)
+    return series.astype(pd.CategoricalDtype(categories))
+
+
+def apply_dtype_policy(df: pd.DataFrame, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Apply the dtype policy to the known ID and text columns of a frame.
+
+    Args:
+        df (pd.DataFrame): Frame to convert, it is not modified
+        columns (Optional[List[str]]): Restrict the policy to these columns
+
+    Returns:
+        pd.DataFrame: Frame with categorical ID and compact text columns
+    """
+    if df is None:
+        return None
+    df = df.copy(deep=False)
+    string_dtype = text_dtype()
+    for col in df.columns:
+        if columns is not None and col not in columns:
+            continue
+        if col in CATEGORY_GROUPS:
+            df[col] = to_shared_categorical(df[col], CATEGORY_GROUPS[col])
+        elif col in TEXT_COLUMNS and df[col].dtype == object:
+            # Cells Excel parsed as numbers are kept as their text
+            values = df[col]
+            df[col] = values.where(values.isna(), values.astype(str)).astype(string_dtype)
+    return df
+
+
+def align_categories(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Extend the categoricals of a frame to the current shared categories.
+
+    Frames converted before other frames registered new values hold a prefix of
+    the shared categories; aligning them makes their dtypes equal again.
+
+    Args:
+        df (pd.DataFrame): Frame to align, it is not modified
+
+    Returns:
+        pd.DataFrame: Frame whose shared categoricals use the current categories
+    """
+    if df is None:
+        return None
+    df = df.copy(deep=False)
+    for col in df.columns:
+        if col in CATEGORY_GROUPS and isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.set_categories(shared_categories(CATEGORY_GROUPS[col]))
+    return df
+
+
+def match_key_dtype(left: pd.DataFrame, right: pd.DataFrame, column: str, group: str):
+    """
+    Give a join key the same shared categorical dtype in both frames.
+
+    Args:
+        left (pd.DataFrame): Left frame of the join
+        right (pd.DataFrame): Right frame of the join
+        column (str): Join key present in both frames
+        group (str): Category group of the key
+
+    Returns:
+        tuple: (left, right) with categorical keys, frames are not modified
+    """
+    register_categories(group, left[column])
+    register_categories(group, right[column])
+    left = left.copy(deep=False)
+    right = right.copy(deep=False)
+    left[column] = to_shared_categorical(left[column], group)
+    right[column] = to_shared_categorical(right[column], group)
+    return left, right
+
+
+def map_values(series: pd.Series, func: Callable) -> pd.Series:
+    """
+    Apply a function to each distinct value of a column instead of every row.
+
+    Args:
+        series (pd.Series): Column to map, categorical or not
+        func (Callable): Function applied to every distinct value, missing included
+
+    Returns:
+        pd.Series: Mapped column, categorical if the input was categorical,
+            otherwise object dtype
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        uniques = series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+
+    # Missing values have code -1, which picks the last slot
+    mapped = np.empty(len(uniques) + 1, dtype=object)
+    mapped[:len(uniques)] = [func(v) for v in uniques]
+    mapped[-1] = func(np.nan)
+
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        new_codes, new_uniques = pd.factorize(mapped, use_na_sentinel=True)
+        return pd.Series(pd.Categorical.from_codes(new_codes[codes], categories=new_uniques),
+                         index=series.index, name=series.name)
+    return pd.Series(mapped[codes], index=series.index, name=series.name, dtype=object)
@@ -0,0 +1,380 @@
+"""
+evaluation_service.py
+
+Long-running local evaluation service for review sprints.
+Loads the inputs and feedback workbooks once, keeps the parsed frames and
+review status in memory and serves review status, per-query detail and
+stats aggregates over a small local HTTP API on TCP or a Unix socket.
+A refresh re-parses only the workbooks that changed; parsing and
+recomputation run in a worker pool so requests are never blocked. Feedback
+is validated as in main.py first; invalid feedback keeps the previous state
+and its issues are reported on /status and in the refresh response.
+
+Dependencies:
+    - pandas
+"""
+
+# Built-in library
+import os
+import io
+import json
+import asyncio
+import logging
+import argparse
+import contextlib
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+# Custom/User-defined module
+import main
+import feedback_data
+import generate_datafiles
+import dtype_policy
+import validation
+import evaluation_store
+
+# Third-party library
+import pandas as pd
+
+DETAIL_COLUMNS = ['SME', 'Unable to Review'] + feedback_data.DIMENSION_COLUMNS + ['Notes']
+
+# Layout of a parsed Feedback sheet, used when there is no workbook yet
+FEEDBACK_COLUMNS = [column for column in evaluation_store.FEEDBACK_FIELDS if column != 'SME'] + ['SME']
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+def setup_args() -> argparse.ArgumentParser:
+    """
+    Setup command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Serve review status from in-memory evaluation state.')
+    parser.add_argument('feedback_directory', type=str, help='Directory with feedback and disagreement data.')
+    parser.add_argument(
+        'input_directory',
+        type=str,
+        help='Directory with input data queries_metadata,publication file,query_output and sme_master data.'
+    )
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on.')
+    parser.add_argument('--unix-socket', type=str, default=None, help='Listen on this Unix socket instead of TCP.')
+    parser.add_argument('--workers', type=int, default=4, help='Worker processes for parsing and recomputation.')
+    parser.add_argument('--skip-validation', action='store_true',
+                        help='Serve feedback with validation issues (missing columns, unknown scores or SMEs, duplicates).')
+    return parser
+
+
+def workbook_signature(path: str) -> Tuple[int, int]:
+    """
+    Size and modification time of a workbook, used to detect changes.
+    """
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def load_inputs(input_directory: str) -> Optional[Dict[str, pd.DataFrame]]:
+    """
+    Load the input files and SME master list.
+
+    Args:
+        input_directory (str): Directory containing the input files
+
+    Returns:
+        Optional[Dict[str, pd.DataFrame]]: Input frames, None when loading failed
+    """
+    query_metadata, query_feedback, query_reference, publication, query_failed = main.load_all_inputfile(
+        input_directory)
+    if query_metadata is None:
+        return None
+    sme_ready, _ = main.load_sme_master_list(input_directory)
+    if sme_ready is None:
+        return None
+    query_output, query_reference = generate_datafiles.generate_queryResponse_reference(
+        query_feedback, query_reference, publication, query_failed)
+    return {
+        'publication': publication,
+        'sme_ready': sme_ready,
+        'query_output': query_output,
+        'query_reference': query_reference
+    }
+
+
+def evaluate_snapshot(qa_frames: List[pd.DataFrame], inputs: Dict[str, pd.DataFrame],
+                      sources: Optional[List[feedback_data.WorkbookSource]] = None,
+                      sme_codes: Optional[Set[str]] = None) -> Tuple[Optional[Dict[str, pd.DataFrame]], pd.DataFrame]:
+    """
+    Validate and recompute the evaluation state from parsed workbooks, run in a worker process.
+
+    Args:
+        qa_frames (List[pd.DataFrame]): Parsed Feedback sheets in workbook order
+        inputs (Dict[str, pd.DataFrame]): Frames returned by load_inputs
+        sources (Optional[List[WorkbookSource]]): Source of every workbook, in workbook order
+        sme_codes (Optional[Set[str]]): Known SME codes, None skips the validation
+
+    Returns:
+        Tuple[Optional[Dict[str, pd.DataFrame]], pd.DataFrame]: (frames returned by main.evaluate_feedback,
+            None when the feedback is invalid; validation issues)
+    """
+    # Worker processes are reused, start every snapshot from fresh categories
+    dtype_policy.reset_categories()
+    publication = dtype_policy.apply_dtype_policy(inputs['publication'])
+    query_output = dtype_policy.apply_dtype_policy(inputs['query_output'])
+    feedback = pd.concat(qa_frames, ignore_index=True) if qa_frames else pd.DataFrame(columns=FEEDBACK_COLUMNS)
+    feedback = dtype_policy.apply_dtype_policy(feedback)
+
+    issues = pd.DataFrame(columns=validation.ISSUE_COLUMNS)
+    if sme_codes is not None:
+        issues = validation.validate_feedback(feedback, sme_codes, sources)
+        if not issues.empty:
+            return None, issues
+
+    feedback = feedback[feedback['Query ID'].isin(list(publication['query_id']))]
+    with contextlib.redirect_stdout(io.StringIO()):
+        return main.evaluate_feedback(feedback, inputs['sme_ready'], publication, query_output), issues
+
+
+def records(df: Optional[pd.DataFrame]) -> list:
+    """
+    Convert a frame to JSON-ready records, missing values become null.
+    """
+    if df is None or df.empty:
+        return []
+    return json.loads(df.to_json(orient='records', default_handler=str))
+
+
+class EvaluationService:
+    """
+    In-memory evaluation state with incremental workbook refresh.
+    """
+
+    def __init__(self, feedback_directory: str, input_directory: str, workers: int = 4, validate: bool = True):
+        self.feedback_directory = feedback_directory
+        self.input_directory = input_directory
+        self.validate = validate
+        self.executor = ProcessPoolExecutor(max_workers=max(1, workers))
+        self.inputs: Optional[Dict[str, pd.DataFrame]] = None
+        self.sme_codes: Optional[Set[str]] = None
+        # Issues of the latest snapshot, the previous state is served while there are any
+        self.issues = pd.DataFrame(columns=validation.ISSUE_COLUMNS)
+        # path -> (signature, parsed Feedback sheet)
+        self.workbooks: Dict[str, Tuple[Tuple[int, int], Optional[pd.DataFrame]]] = {}
+        self.results: Dict[str, pd.DataFrame] = {}
+        self.refreshed_at: Optional[str] = None
+        self.refreshing = False
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        """
+        Load the inputs and every workbook once.
+        """
+        loop = asyncio.get_running_loop()
+        self.inputs = await loop.run_in_executor(self.executor, load_inputs, self.input_directory)
+        if self.inputs is None:
+            raise RuntimeError(f"Failed to load input files from {self.input_directory}")
+        if self.validate:
+            self.sme_codes = await loop.run_in_executor(
+                self.executor, validation.load_sme_codes, self.input_directory)
+        await self.refresh()
+
+    async def refresh(self) -> Dict[str, object]:
+        """
+        Re-parse changed workbooks and recompute the state if anything changed.
+
+        Returns:
+            Dict[str, object]: Changed and removed workbooks, whether the state was recomputed and
+                the validation issues that held it back
+        """
+        async with self._lock:
+            self.refreshing = True
+            try:
+                loop = asyncio.get_running_loop()
+                paths = await loop.run_in_executor(None, feedback_data.get_feedback_files, self.feedback_directory)
+                signatures = {path: await loop.run_in_executor(None, workbook_signature, path) for path in paths}
+                changed = [path for path in paths
+                           if path not in self.workbooks or self.workbooks[path][0] != signatures[path]]
+                removed = [path for path in self.workbooks if path not in signatures]
+
+                parsed = await asyncio.gather(*(
+                    loop.run_in_executor(self.executor, feedback_data.load_feedback_workbook, path)
+                    for path in changed))
+                for path, (df_qa, _) in zip(changed, parsed):
+                    self.workbooks[path] = (signatures[path], df_qa)
+                for path in removed:
+                    del self.workbooks[path]
+
+                recomputed = False
+                if changed or removed or not self.results:
+                    qa_frames = [self.workbooks[path][1] for path in paths if self.workbooks[path][1] is not None]
+                    sources = [feedback_data.workbook_source(path, self.workbooks[path][1]) for path in paths]
+                    # The previous state keeps serving requests until the new one is swapped in
+                    results, self.issues = await loop.run_in_executor(
+                        self.executor, evaluate_snapshot, qa_frames, self.inputs, sources, self.sme_codes)
+                    if results is None:
+                        validation.report_issues(self.issues)
+                        logging.error('Keeping the previous state until the feedback is fixed')
+                    else:
+                        self.results = results
+                        self.refreshed_at = datetime.now(timezone.utc).isoformat()
+                        recomputed = True
+                logging.info("Refresh: %d changed, %d removed workbooks", len(changed), len(removed))
+                return {'changed': changed, 'removed': removed, 'recomputed': recomputed,
+                        'refreshed_at': self.refreshed_at, 'validation_issues': records(self.issues)}
+            finally:
+                self.refreshing = False
+
+    def summary(self) -> Dict[str, object]:
+        """
+        Review status counts and refresh information.
+        """
+        review_status = self.results.get('review_status')
+        counts = {} if review_status is None else review_status['Review status'].value_counts().to_dict()
+        include = {} if review_status is None else review_status['include_exclude'].value_counts().to_dict()
+        return {
+            'workbooks': len(self.workbooks),
+            'queries': 0 if review_status is None else len(review_status),
+            'review_status': counts,
+            'include_exclude': include,
+            'refreshed_at': self.refreshed_at,
+            'refreshing': self.refreshing,
+            'validation_issues': records(self.issues)
+        }
+
+    def review_status(self, params: Dict[str, str]) -> list:
+        """
+        Review status rows, optionally filtered by status, inclusion or pending SME.
+        """
+        df = self.results.get('query_status')
+        if df is None:
+            return []
+        if 'status' in params:
+            df = df[df['Review status'] == params['status']]
+        if 'sme' in params:
+            df = df[df['SMEs_yet_to_review'].astype(str).str.split(',').apply(lambda smes: params['sme'] in smes)]
+        return records(df)
+
+    def query_detail(self, query_id: str) -> Optional[Dict[str, object]]:
+        """
+        Status, per-SME ratings and final scores of one query.
+        """
+        query_status = self.results.get('query_status')
+        if query_status is None:
+            return None
+        status = query_status[query_status['Query ID'] == query_id]
+        if status.empty:
+            return None
+        cleaned = self.results['cleaned_feedback']
+        transformed = self.results['transformed']
+        ratings = cleaned.loc[cleaned['Query ID'] == query_id, DETAIL_COLUMNS]
+        final = transformed[transformed['Query ID'] == query_id] if 'Query ID' in transformed else transformed.iloc[0:0]
+        return {
+            'status': records(status)[0],
+            'ratings': records(ratings),
+            'transformed': records(final)
+        }
+
+    def stats(self) -> list:
+        """
+        Aggregate scores with confidence intervals, as in stats.xlsx.
+        """
+        return records(self.results.get('stats'))
+
+    async def handle(self, method: str, target: str) -> Tuple[int, object]:
+        """
+        Route a request to the matching handler.
+
+        Returns:
+            Tuple[int, object]: HTTP status and JSON body
+        """
+        url = urlsplit(target)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split('/') if part]
+
+        if parts == ['refresh']:
+            if method != 'POST':
+                return 405, {'error': 'use POST to refresh'}
+            return 200, await self.refresh()
+        if method != 'GET':
+            return 405, {'error': f'{method} is not supported'}
+        if parts in ([], ['status']):
+            return 200, self.summary()
+        if parts == ['review-status']:
+            return 200, self.review_status(params)
+        if len(parts) == 2 and parts[0] == 'queries':
+            detail = self.query_detail(parts[1])
+            return (200, detail) if detail is not None else (404, {'error': f'unknown query {parts[1]}'})
+        if parts == ['stats']:
+            return 200, self.stats()
+        return 404, {'error': f'no route for {url.path}'}
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Answer one HTTP/1.1 request and close the connection.
+        """
+        try:
+            request_line = (await reader.readline()).decode('latin-1').strip()
+            content_length = 0
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                if name.lower() == 'content-length':
+                    content_length = int(value.strip() or 0)
+            if content_length:
+                await reader.readexactly(content_length)
+
+            try:
+                method, target, _ = request_line.split(' ', 2)
+                status, body = await self.handle(method.upper(), target)
+            except ValueError:
+                status, body = 400, {'error': 'malformed request'}
+            except Exception as e:
+                logging.exception("Request failed: %s", request_line)
+                status, body = 500, {'error': str(e)}
+
+            payload = json.dumps(body, default=str).encode('utf-8')
+            writer.write((f'HTTP/1.1 {status} {HTTP_REASONS.get(status, "")}\r\n'
+                          'Content-Type: application/json\r\n'
+                          f'Content-Length: {len(payload)}\r\n'
+                          'Connection: close\r\n\r\n').encode('latin-1') + payload)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def run(self, host: str = '127.0.0.1', port: int = 8765, unix_socket: Optional[str] = None):
+        """
+        Load the state and serve requests until cancelled.
+        """
+        await self.start()
+        if unix_socket:
+            server = await asyncio.start_unix_server(self.serve_connection, path=unix_socket)
+            logging.info("Serving on unix socket %s", unix_socket)
+        else:
+            server = await asyncio.start_server(self.serve_connection, host, port)
+            logging.info("Serving on http://%s:%d", host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        """
+        Stop the worker pool.
+        """
+        self.executor.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = setup_args()
+    args = parser.parse_args()
+
+    service = EvaluationService(args.feedback_directory, args.input_directory, args.workers,
+                                not args.skip_validation)
+    try:
+        asyncio.run(service.run(args.host, args.port, args.unix_socket))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
@@ -0,0 +1,356 @@
+"""
+evaluation_store.py
+
+This module provides an optional local SQLite store for parsed feedback.
+Feedback rows are replaced per workbook, keyed on their workbook and sheet
+row and indexed by (Query ID, SME) and SME, so a changed workbook only
+rewrites its own rows and status lookups are indexed reads instead of full
+pipeline reruns. The store holds the same rows as the workbooks, duplicates
+included, and the Feedback header of every workbook, so validation sees the
+same feedback with or without it.
+
+Dependencies:
+    - pandas
+    - sqlite3
+"""
+
+# Third-party library
+import pandas as pd
+
+# Built-in library
+import os
+import json
+import logging
+import sqlite3
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+# Custom/User-defined module
+import feedback_data
+
+# Feedback sheet columns and their store column names
+FEEDBACK_FIELDS = {
+    'Query ID': 'query_id',
+    'SME': 'sme',
+    'Query': 'query',
+    'Response URL': 'response_url',
+    'Response': 'response',
+    'Unable to Review': 'unable_to_review',
+    'Overall Answer Helpfulness': 'overall',
+    'Comprehension': 'comprehension',
+    'Correctness': 'correctness',
+    'Completeness': 'completeness',
+    'Clinical Harmfulness': 'harmfulness',
+    'Clinical Harmfulness Level': 'harmful_level',
+    'Notes': 'notes'
+}
+
+# Bumped when the tables change, older stores are rebuilt from the workbooks
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workbooks (
+    path TEXT PRIMARY KEY,
+    position INTEGER NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ingested_at TEXT NOT NULL,
+    has_sheet INTEGER NOT NULL DEFAULT 1,
+    -- JSON list of the Feedback sheet columns
+    columns TEXT
+);
+CREATE TABLE IF NOT EXISTS feedback (
+    query_id TEXT,
+    sme TEXT,
+    source_file TEXT NOT NULL,
+    row_number INTEGER NOT NULL,
+    query TEXT,
+    response_url TEXT,
+    response TEXT,
+    unable_to_review TEXT,
+    overall,
+    comprehension,
+    correctness,
+    completeness,
+    harmfulness,
+    harmful_level,
+    notes TEXT,
+    -- A row belongs to its workbook, the same (query_id, sme) may come from several
+    PRIMARY KEY (source_file, row_number)
+);
+-- Also serves lookups by query_id alone
+CREATE INDEX IF NOT EXISTS idx_feedback_query_sme ON feedback (query_id, sme);
+CREATE INDEX IF NOT EXISTS idx_feedback_sme ON feedback (sme);
+CREATE TABLE IF NOT EXISTS reference (
+    query_id TEXT NOT NULL,
+    sme TEXT,
+    source_file TEXT NOT NULL,
+    row_number INTEGER NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reference_query ON reference (query_id);
+CREATE INDEX IF NOT EXISTS idx_reference_source ON reference (source_file);
+"""
+
+
+def setup_args() -> argparse.ArgumentParser:
+    """
+    Setup command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Answer status lookups from the evaluation store.')
+    parser.add_argument('store', type=str, help='SQLite evaluation store written by main.py --store.')
+    parser.add_argument('--feedback-directory', type=str, default=None,
+                        help='Ingest new or changed workbooks of this directory before the lookup.')
+    lookups = parser.add_subparsers(dest='lookup', required=True)
+    pending = lookups.add_parser('pending', help='Queries an SME still has to review.')
+    pending.add_argument('sme', type=str, help='SME code, e.g. EVAL-012.')
+    query = lookups.add_parser('query', help='SMEs assigned to a query and the ones unable to review it.')
+    query.add_argument('query_id', type=str, help='Query ID.')
+    lookups.add_parser('counts', help='Number of stored workbooks, feedback rows and reference rows.')
+    return parser
+
+
+def _cell(value):
+    """
+    Convert a frame cell to a value SQLite can store, missing values become NULL.
+    """
+    if isinstance(value, (list, tuple)):
+        return ",".join(str(v) for v in value)
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, (str, int, float, bytes)):
+        return value
+    return str(value)
+
+
+def _file_signature(path: str) -> Tuple[int, int]:
+    """
+    Size and modification time of a file, used to detect changed workbooks.
+    """
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class EvaluationStore:
+    """
+    Local SQLite store of parsed feedback rows.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): SQLite database file, created if it does not exist
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        if version < SCHEMA_VERSION:
+            # The store only caches the workbooks, an outdated one is dropped and re-parsed
+            with self.connection:
+                for table in ('workbooks', 'feedback', 'reference', 'review_status'):
+                    self.connection.execute(f'DROP TABLE IF EXISTS {table}')
+        self.connection.executescript(SCHEMA)
+        self.connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        self.connection.close()
+
+    def __enter__(self) -> 'EvaluationStore':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def changed_workbooks(self, paths: List[str]) -> List[str]:
+        """
+        Select the workbooks that are new or changed since they were last ingested.
+
+        Args:
+            paths (List[str]): Paths to feedback files
+
+        Returns:
+            List[str]: Paths whose size or modification time differ from the store
+        """
+        known = {row[0]: (row[1], row[2]) for row in
+                 self.connection.execute('SELECT path, size, mtime_ns FROM workbooks')}
+        return [path for path in paths if known.get(os.path.abspath(path)) != _file_signature(path)]
+
+    def upsert_workbook(self, path: str, feedback: Optional[pd.DataFrame], references: Optional[pd.DataFrame]):
+        """
+        Replace the rows and Feedback header of one workbook in a single transaction.
+
+        Args:
+            path (str): Path to the feedback file
+            feedback (Optional[pd.DataFrame]): Parsed Feedback sheet with an SME column
+            references (Optional[pd.DataFrame]): Parsed References sheet with an SME column
+        """
+        source = os.path.abspath(path)
+        size, mtime_ns = _file_signature(path)
+        with self.connection:
+            self.connection.execute('DELETE FROM feedback WHERE source_file = ?', (source,))
+            self.connection.execute('DELETE FROM reference WHERE source_file = ?', (source,))
+
+            if feedback is not None and len(feedback):
+                fields = list(FEEDBACK_FIELDS.values())
+                rows = []
+                for row_number, record in enumerate(feedback.to_dict('records')):
+                    rows.append([_cell(record.get(col)) for col in FEEDBACK_FIELDS] + [source, row_number])
+                columns = fields + ['source_file', 'row_number']
+                self.connection.executemany(
+                    f'INSERT INTO feedback ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                    rows)
+
+            if references is not None and len(references):
+                rows = []
+                for row_number, record in enumerate(references.to_dict('records')):
+                    payload = {str(k): _cell(v) for k, v in record.items() if k not in ('Query ID', 'SME')}
+                    rows.append((_cell(record['Query ID']), _cell(record.get('SME')), source, row_number,
+                                 json.dumps(payload, default=str)))
+                self.connection.executemany(
+                    'INSERT INTO reference (query_id, sme, source_file, row_number, payload) VALUES (?, ?, ?, ?, ?)',
+                    rows)
+
+            header = json.dumps([str(column) for column in feedback.columns]) if feedback is not None else '[]'
+            self.connection.execute(
+                'INSERT INTO workbooks (path, size, mtime_ns, ingested_at, has_sheet, columns) '
+                'VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, '
+                'ingested_at = excluded.ingested_at, has_sheet = excluded.has_sheet, columns = excluded.columns',
+                (source, size, mtime_ns, datetime.now(timezone.utc).isoformat(), int(feedback is not None), header))
+
+    def sync_workbooks(self, paths: List[str]) -> List[str]:
+        """
+        Record the order of the current workbooks and remove the rows of missing ones.
+
+        Rows are read back in the order of paths, which is the row order of
+        load_raw_feedback without a store.
+
+        Args:
+            paths (List[str]): Paths to the current feedback files
+
+        Returns:
+            List[str]: Removed workbook paths
+        """
+        position = {os.path.abspath(path): i for i, path in enumerate(paths)}
+        stored = [row[0] for row in self.connection.execute('SELECT path FROM workbooks')]
+        removed = [path for path in stored if path not in position]
+        with self.connection:
+            for path in removed:
+                self.connection.execute('DELETE FROM feedback WHERE source_file = ?', (path,))
+                self.connection.execute('DELETE FROM reference WHERE source_file = ?', (path,))
+                self.connection.execute('DELETE FROM workbooks WHERE path = ?', (path,))
+            self.connection.executemany('UPDATE workbooks SET position = ? WHERE path = ?',
+                                        [(i, path) for path, i in position.items()])
+        return removed
+
+    def load_feedback(self) -> pd.DataFrame:
+        """
+        Read every stored feedback row in the layout of load_raw_feedback.
+
+        Returns:
+            pd.DataFrame: Feedback rows ordered by workbook and sheet row
+        """
+        fields = ', '.join(f'f.{col}' for col in FEEDBACK_FIELDS.values())
+        df = pd.read_sql_query(
+            f'SELECT {fields} FROM feedback f JOIN workbooks w ON w.path = f.source_file '
+            'ORDER BY w.position, f.row_number', self.connection)
+        df.columns = list(FEEDBACK_FIELDS)
+        columns = [col for col in FEEDBACK_FIELDS if col != 'SME'] + ['SME']
+        return df[columns]
+
+    def workbook_rows(self) -> List[Tuple[str, int, bool, List[str]]]:
+        """
+        Stored feedback rows and Feedback header per workbook, in the row order of load_feedback.
+
+        Returns:
+            List[Tuple[str, int, bool, List[str]]]: (path, rows, has Feedback sheet, sheet columns) per workbook
+        """
+        rows = self.connection.execute(
+            'SELECT w.path, COUNT(f.row_number), w.has_sheet, w.columns FROM workbooks w '
+            'LEFT JOIN feedback f ON f.source_file = w.path GROUP BY w.path ORDER BY w.position').fetchall()
+        return [(path, count, bool(has_sheet), json.loads(columns or '[]'))
+                for path, count, has_sheet, columns in rows]
+
+    def load_references(self) -> pd.DataFrame:
+        """
+        Read every stored reference row in the layout of load_raw_feedback.
+
+        Returns:
+            pd.DataFrame: Reference rows ordered by workbook and sheet row
+        """
+        rows = self.connection.execute(
+            'SELECT r.query_id, r.sme, r.payload FROM reference r JOIN workbooks w ON w.path = r.source_file '
+            'ORDER BY w.position, r.row_number').fetchall()
+        records = [dict({'Query ID': query_id}, **json.loads(payload), SME=sme)
+                   for query_id, sme, payload in rows]
+        return pd.DataFrame(records)
+
+    def query_smes(self, query_id: str) -> Tuple[List[str], List[str]]:
+        """
+        Indexed lookup of the SMEs assigned to a query.
+
+        Args:
+            query_id (str): Query ID
+
+        Returns:
+            Tuple[List[str], List[str]]: (assigned SMEs, SMEs unable to review)
+        """
+        rows = self.connection.execute(
+            'SELECT f.sme, f.unable_to_review FROM feedback f JOIN workbooks w ON w.path = f.source_file '
+            'WHERE f.query_id = ? ORDER BY w.position, f.row_number',
+            (query_id,)).fetchall()
+        assigned = [sme for sme, _ in rows]
+        unable = [sme for sme, mark in rows if mark == 'X']
+        return assigned, unable
+
+    def pending_queries(self, sme: str) -> List[str]:
+        """
+        Indexed lookup of the queries an SME still has to review.
+
+        Args:
+            sme (str): SME code, e.g. EVAL-012
+
+        Returns:
+            List[str]: Query IDs assigned to the SME without the required ratings
+        """
+        rows = self.connection.execute(
+            "SELECT query_id FROM feedback WHERE sme = ? AND (unable_to_review IS NULL OR unable_to_review != 'X') "
+            "AND (overall IS NULL OR comprehension IS NULL OR harmfulness IS NULL) ORDER BY query_id",
+            (sme,)).fetchall()
+        return [row[0] for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Number of stored workbooks, feedback rows and reference rows.
+        """
+        return {table: self.connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('workbooks', 'feedback', 'reference')}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = setup_args()
+    args = parser.parse_args()
+
+    with EvaluationStore(args.store) as store:
+        if args.feedback_directory:
+            feedback, _ = feedback_data.load_raw_feedback(feedback_data.get_feedback_files(args.feedback_directory), store)
+            if feedback is None:
+                logging.error("Failed to ingest feedback from %s", args.feedback_directory)
+                exit(1)
+        if args.lookup == 'pending':
+            print("\n".join(store.pending_queries(args.sme)))
+        elif args.lookup == 'query':
+            assigned, unable = store.query_smes(args.query_id)
+            print(json.dumps({'assigned': assigned, 'unable_to_review': unable}))
+        else:
+            print(json.dumps(store.counts()))
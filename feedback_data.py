@@ -12,30 +12,106 @@ Dependencies:
 
 # Third-party libraries
 import pandas as pd
-import openpyxl as xl
 import numpy as np
 
 
 # Built-in libraries
 import re
 import os
-import glob
 import traceback
-from typing import Tuple, List, Optional, Union
+from typing import Dict, Tuple, List, NamedTuple, Optional, Union
+
+# Custom/User-defined module
+import dtype_policy
+
+# Rating columns converted to dimension scores
+DIMENSION_COLUMNS = [
+    'Overall Answer Helpfulness',
+    'Comprehension',
+    'Correctness',
+    'Completeness',
+    'Clinical Harmfulness',
+    'Clinical Harmfulness Level'
+]
+
+# Overall Answer Helpfulness emoji ratings and their scores
+OVERALL_EMOJI_MAP = {
+    ' 🙁': 0,
+    ' 😐': 1,
+    ' 😀': 2
+}
+
+class WorkbookSource(NamedTuple):
+    """
+    Feedback rows contributed by one workbook, in row order of the combined feedback.
+    """
+    path: str
+    rows: int
+    has_sheet: bool
+    # Columns of the Feedback sheet, None when unknown
+    columns: Optional[List[str]]
+
+def workbook_source(path: str, df_qa: Optional[pd.DataFrame]) -> WorkbookSource:
+    """
+    Describe the Feedback sheet parsed from a workbook.
+
+    Args:
+        path (str): Path to the feedback file
+        df_qa (Optional[pd.DataFrame]): Parsed Feedback sheet, None when the sheet is missing
+
+    Returns:
+        WorkbookSource: Source entry of the workbook
+    """
+    if df_qa is None:
+        return WorkbookSource(path, 0, False, [])
+    return WorkbookSource(path, len(df_qa), True, [str(column) for column in df_qa.columns])
+
+def scan_feedback_files(main_directory: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Build a manifest of the feedback Excel files with a single directory walk.
+
+    Files are listed in the same order as a recursive glob: the files of a
+    directory first, then its subdirectories depth first, hidden entries skipped.
+
+    Args:
+        main_directory (str): Root directory to search for feedback files
+
+    Returns:
+        Dict[str, Tuple[int, int]]: Path of each feedback file mapped to its (size, mtime_ns)
+    """
+    manifest = {}
+
+    def walk(directory: str):
+        subdirectories = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir():
+                        subdirectories.append(entry.path)
+                    elif entry.name.startswith('feedback') and entry.name.endswith('.xlsm'):
+                        stat = entry.stat()
+                        manifest[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            return
+        for subdirectory in subdirectories:
+            walk(subdirectory)
+
+    walk(main_directory)
+    return manifest
 
 def get_feedback_files(main_directory: str) -> List[str]:
     """
     Find all feedback Excel files in the specified directory and its subdirectories.
-    
+
     Args:
         main_directory (str): Root directory to search for feedback files
-        
+
     Returns:
         List[str]: List of paths to feedback files
     """
-    pattern = os.path.join(main_directory, '**', '*.xlsm')
-    xlsm_files = glob.glob(pattern, recursive=True)
-    return [file for file in xlsm_files if os.path.basename(file).startswith('feedback')]
+    return list(scan_feedback_files(main_directory))
 
 def extract_sme_code(filename: str) -> Optional[str]:
     """
@@ -65,43 +141,87 @@ def dimension_index(x: Union[str, float]) -> str:
         return 'na'
     return x.split('--')[0].strip()
 
-def load_raw_feedback(datapathlist: List[str]) -> Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]:
+def load_feedback_workbook(path: str) -> Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]:
+    """
+    Load the feedback and reference sheets of a single feedback workbook.
+    
+    Args:
+        path (str): Path to the feedback file
+        
+    Returns:
+        Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]: 
+            Tuple of (QA data, reference data), None for a missing sheet
+    """
+    sme_name = extract_sme_code(path)
+    df_qa = None
+    df_ref = None
+    
+    # One workbook handle serves the sheet names and both sheets
+    with pd.ExcelFile(path, engine='openpyxl') as book:
+        if 'Feedback' in book.sheet_names:
+            df_qa = book.parse(sheet_name='Feedback')
+            headers = df_qa.iloc[0]
+            df_qa = pd.DataFrame(df_qa.values[1:], columns=headers)
+            df_qa['SME'] = sme_name
+            if 'Query ID' in df_qa:
+                df_qa = df_qa.dropna(subset=['Query ID'])
+            else:
+                # Rows cannot be keyed, only the columns are kept for validation
+                df_qa = df_qa.iloc[0:0]
+            
+        if 'References' in book.sheet_names:
+            df_ref = book.parse(sheet_name='References')
+            df_ref['SME'] = sme_name
+            df_ref = df_ref.dropna(subset=['Query ID'])
+            
+    return df_qa, df_ref
+
+def load_raw_feedback(datapathlist: List[str], store=None,
+                      sources: Optional[List[WorkbookSource]] = None) -> Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]:
     """
     Load and process feedback data from Excel files.
     
     Args:
         datapathlist (List[str]): List of paths to feedback files
+        store (Optional[EvaluationStore]): Evaluation store to upsert parsed rows into.
+            Only new or changed workbooks are parsed and the stored rows are returned.
+        sources (Optional[List[WorkbookSource]]): Filled with one entry per workbook, in the
+            row order of the QA data
         
     Returns:
         Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]: 
             Tuple of (QA data, reference data) DataFrames
     """
     try:
-        qa_data_list = []
-        ref_data_list = []
-        
-        for path in datapathlist:
-            sme_name = extract_sme_code(path)
-            book = xl.load_workbook(path)
+        workbooks = []
+        if store is not None:
+            for path in store.changed_workbooks(datapathlist):
+                df_qa, df_ref = load_feedback_workbook(path)
+                store.upsert_workbook(path, df_qa, df_ref)
+            store.sync_workbooks(datapathlist)
+            combined_qa, combined_ref = store.load_feedback(), store.load_references()
+            # Headers are stored too, so unchanged workbooks are validated like parsed ones
+            workbooks = [WorkbookSource(*workbook) for workbook in store.workbook_rows()]
+        else:
+            qa_data_list = []
+            ref_data_list = []
             
-            if 'Feedback' in book.sheetnames:
-                df_qa = pd.read_excel(path, sheet_name='Feedback')
-                headers = df_qa.iloc[0]
-                df_qa = pd.DataFrame(df_qa.values[1:], columns=headers)
-                df_qa['SME'] = sme_name
-                df_qa = df_qa.dropna(subset=['Query ID'])
-                qa_data_list.append(df_qa)
+            for path in datapathlist:
+                df_qa, df_ref = load_feedback_workbook(path)
+                workbooks.append(workbook_source(path, df_qa))
+                if df_qa is not None:
+                    qa_data_list.append(df_qa)
+                if df_ref is not None:
+                    ref_data_list.append(df_ref)
                 
-            if 'References' in book.sheetnames:
-                df_ref = pd.read_excel(path, sheet_name='References')
-                df_ref['SME'] = sme_name
-                df_ref = df_ref.dropna(subset=['Query ID'])
-                ref_data_list.append(df_ref)
-                
-            book.close()  # Properly close workbook
-            
-        combined_qa = pd.concat(qa_data_list, ignore_index=True) if qa_data_list else pd.DataFrame()
-        combined_ref = pd.concat(ref_data_list, ignore_index=True) if ref_data_list else pd.DataFrame()
+            combined_qa = pd.concat(qa_data_list, ignore_index=True) if qa_data_list else pd.DataFrame()
+            combined_ref = pd.concat(ref_data_list, ignore_index=True) if ref_data_list else pd.DataFrame()
+        
+        # Compact dtypes, IDs share their categories with the input files
+        combined_qa = dtype_policy.apply_dtype_policy(combined_qa)
+        combined_ref = dtype_policy.apply_dtype_policy(combined_ref)
+        if sources is not None:
+            sources.extend(workbooks)
         
         return combined_qa, combined_ref
         
@@ -110,6 +230,47 @@ def load_raw_feedback(datapathlist: List[str]) -> Tuple[Optional[pd.DataFrame],
         traceback.print_exc()
         return None, None
 
+def reviewed_mask(feedback: pd.DataFrame) -> pd.Series:
+    """
+    Build a boolean mask of the reviewed rows meeting specific criteria.
+    
+    Args:
+        feedback (pd.DataFrame): Input feedback data
+        
+    Returns:
+        pd.Series: True for reviewed rows, aligned with the feedback index
+    """
+    # Filter out unreviewed queries
+    mask = feedback['Unable to Review'] != 'X'
+    
+    # Remove entries missing critical ratings
+    mask &= feedback[[
+        'Overall Answer Helpfulness',
+        'Comprehension',
+        'Clinical Harmfulness'
+    ]].notna().all(axis=1)
+    
+    # Filter comprehension scores
+    comprehend = mask & (feedback['Comprehension'] != '0')
+    
+    # Handle 'na' values
+    na_rows = comprehend & ((feedback['Correctness'] == 'na') | (feedback['Completeness'] == 'na'))
+    na_queries = feedback.loc[na_rows, 'Query ID'].unique()
+    
+    return mask & ~feedback['Query ID'].isin(na_queries)
+
+def unable_to_review_mask(feedback: pd.DataFrame) -> pd.Series:
+    """
+    Build a boolean mask of the rows marked as unable to review.
+    
+    Args:
+        feedback (pd.DataFrame): Input feedback data
+        
+    Returns:
+        pd.Series: True for unable to review rows, aligned with the feedback index
+    """
+    return feedback['Unable to Review'] == 'X'
+
 def get_reviewed_queries(feedback: pd.DataFrame) -> Optional[pd.DataFrame]:
     """
     Filter for reviewed queries meeting specific criteria.
@@ -121,26 +282,7 @@ def get_reviewed_queries(feedback: pd.DataFrame) -> Optional[pd.DataFrame]:
         Optional[pd.DataFrame]: Filtered feedback data
     """
     try:
-        # Filter out unreviewed queries
-        feedback = feedback[feedback['Unable to Review'] != 'X']
-        
-        # Remove entries missing critical ratings
-        feedback = feedback.dropna(subset=[
-            'Overall Answer Helpfulness',
-            'Comprehension',
-            'Clinical Harmfulness'
-        ])
-        
-        # Filter comprehension scores
-        comprehend = feedback[feedback['Comprehension'] != '0']
-        
-        # Handle 'na' values
-        na_queries = set(
-            list(comprehend[comprehend['Correctness'] == 'na']['Query ID']) +
-            list(comprehend[comprehend['Completeness'] == 'na']['Query ID'])
-        )
-        
-        return feedback[~feedback['Query ID'].isin(na_queries)]
+        return feedback[reviewed_mask(feedback)]
         
     except Exception as e:
         print(f"Error in get_reviewed_queries: {str(e)}")
@@ -158,7 +300,7 @@ def get_unable_to_review_queries(feedback: pd.DataFrame) -> Optional[pd.DataFram
         Optional[pd.DataFrame]: Filtered feedback data
     """
     try:
-        return feedback[feedback['Unable to Review'] == 'X']
+        return feedback[unable_to_review_mask(feedback)]
     except Exception as e:
         print(f"Error in get_unable_to_review_queries: {str(e)}")
         traceback.print_exc()
@@ -175,30 +317,18 @@ def convert_to_dimensionscore(feedback: pd.DataFrame) -> Optional[pd.DataFrame]:
         Optional[pd.DataFrame]: Processed feedback data with numerical scores
     """
     try:
-        # Create a copy to avoid modifying original DataFrame
-        feedback = feedback.copy()
+        # Shallow copy, the converted columns are replaced rather than written
+        # in place so the original DataFrame and its text columns are shared
+        feedback = feedback.copy(deep=False)
         
         # Convert emoji ratings to numerical scores
-        emoji_map = {
-            ' 🙁': 0,
-            ' 😐': 1,
-            ' 😀': 2
-        }
-        
-        feedback['Overall Answer Helpfulness'] = feedback['Overall Answer Helpfulness'].map(
-            emoji_map).fillna(feedback['Overall Answer Helpfulness'])
+        overall = feedback['Overall Answer Helpfulness']
+        feedback['Overall Answer Helpfulness'] = dtype_policy.map_values(
+            overall, lambda x: OVERALL_EMOJI_MAP.get(x, x))
         
         # Process dimension columns
-        dimension_columns = [
-            'Comprehension',
-            'Correctness',
-            'Completeness',
-            'Clinical Harmfulness',
-            'Clinical Harmfulness Level'
-        ]
-        
-        for col in dimension_columns:
-            feedback[col] = feedback[col].apply(dimension_index)
+        for col in DIMENSION_COLUMNS[1:]:
+            feedback[col] = dtype_policy.map_values(feedback[col], dimension_index)
             
         return feedback
         
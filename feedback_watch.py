@@ -0,0 +1,203 @@
+"""
+feedback_watch.py
+
+This module supports the watch mode of main.py.
+It polls the manifest of feedback workbooks, waits for bursts of saves
+to settle, re-parses only the workbooks that changed and reports which
+queries they touch, so only those queries are re-evaluated.
+
+Dependencies:
+    - pandas
+"""
+
+# Third-party library
+import pandas as pd
+
+# Built-in library
+import time
+import logging
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+# Custom/User-defined module
+import feedback_data
+import dtype_policy
+
+Manifest = Dict[str, Tuple[int, int]]
+
+
+def diff_manifest(old: Manifest, new: Manifest) -> Tuple[List[str], List[str]]:
+    """
+    Compare two workbook manifests.
+
+    Args:
+        old (Manifest): Previous manifest
+        new (Manifest): Current manifest
+
+    Returns:
+        Tuple[List[str], List[str]]: (new or modified workbooks, removed workbooks)
+    """
+    changed = [path for path, signature in new.items() if old.get(path) != signature]
+    removed = [path for path in old if path not in new]
+    return changed, removed
+
+
+def wait_for_changes(directory: str, manifest: Manifest, interval: float = 5.0, debounce: float = 10.0,
+                     sleep: Callable[[float], None] = time.sleep) -> Manifest:
+    """
+    Poll the feedback directory until its manifest changes and then stays unchanged for the debounce period.
+
+    Args:
+        directory (str): Feedback directory
+        manifest (Manifest): Manifest of the last evaluation
+        interval (float): Seconds between polls
+        debounce (float): Seconds the manifest must stay unchanged before it is returned
+        sleep (Callable[[float], None]): Sleep function
+
+    Returns:
+        Manifest: The settled manifest
+    """
+    current = manifest
+    while current == manifest:
+        sleep(interval)
+        current = feedback_data.scan_feedback_files(directory)
+
+    # Each further save restarts the debounce period
+    settled_at = time.monotonic()
+    while time.monotonic() - settled_at < debounce:
+        sleep(min(interval, debounce))
+        latest = feedback_data.scan_feedback_files(directory)
+        if latest != current:
+            current = latest
+            settled_at = time.monotonic()
+    return current
+
+
+def replace_query_rows(frame: Optional[pd.DataFrame], updates: Optional[pd.DataFrame],
+                       query_ids: Set[str], key: str = 'Query ID') -> pd.DataFrame:
+    """
+    Replace the rows of the given queries with their recomputed rows.
+
+    Rows of other queries keep their order, the recomputed rows are appended.
+
+    Args:
+        frame (Optional[pd.DataFrame]): Current frame
+        updates (Optional[pd.DataFrame]): Recomputed rows of the queries
+        query_ids (Set[str]): Queries whose rows are replaced
+        key (str): Query ID column
+
+    Returns:
+        pd.DataFrame: Updated frame
+    """
+    parts = []
+    if frame is not None and not frame.empty:
+        parts.append(frame[~frame[key].isin(list(query_ids))])
+    if updates is not None and not updates.empty:
+        parts.append(updates)
+    if not parts:
+        return frame if frame is not None else pd.DataFrame()
+    if len(parts) == 2:
+        parts = _union_categoricals(*parts)
+    return pd.concat(parts, ignore_index=True)
+
+
+def _union_categoricals(left: pd.DataFrame, right: pd.DataFrame) -> List[pd.DataFrame]:
+    """
+    Give categorical columns of two frames the union of their categories so concat keeps them categorical.
+    """
+    left = left.copy(deep=False)
+    right = right.copy(deep=False)
+    for col in left.columns.intersection(right.columns):
+        left_dtype, right_dtype = left[col].dtype, right[col].dtype
+        if (isinstance(left_dtype, pd.CategoricalDtype) and isinstance(right_dtype, pd.CategoricalDtype)
+                and left_dtype != right_dtype):
+            categories = left_dtype.categories.append(right_dtype.categories).unique()
+            left[col] = left[col].cat.set_categories(categories)
+            right[col] = right[col].cat.set_categories(categories)
+    return [left, right]
+
+
+class WorkbookCache:
+    """
+    Parsed feedback workbooks kept in memory between evaluations.
+    """
+
+    def __init__(self, store=None):
+        """
+        Args:
+            store (Optional[EvaluationStore]): Evaluation store kept in sync with the cache
+        """
+        self.store = store
+        self.manifest: Manifest = {}
+        self._frames: Dict[str, Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]] = {}
+
+    @staticmethod
+    def _query_ids(frames: Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]) -> Set[str]:
+        df_qa = frames[0]
+        if df_qa is None or 'Query ID' not in df_qa:
+            return set()
+        return set(df_qa['Query ID'].dropna())
+
+    def update(self, manifest: Manifest) -> Set[str]:
+        """
+        Re-parse the new or modified workbooks and drop the removed ones.
+
+        A workbook that cannot be parsed, for example while it is still being
+        saved, keeps its previous rows and is retried on the next update.
+
+        Args:
+            manifest (Manifest): Current manifest of the feedback directory
+
+        Returns:
+            Set[str]: Query IDs found in the old or new rows of the changed workbooks
+        """
+        changed, removed = diff_manifest(self.manifest, manifest)
+        affected = set()
+        accepted = dict(manifest)
+
+        for path in changed:
+            try:
+                frames = feedback_data.load_feedback_workbook(path)
+            except Exception as e:
+                logging.warning("Could not parse %s, retrying on the next change: %s", path, e)
+                if path in self.manifest:
+                    accepted[path] = self.manifest[path]
+                else:
+                    del accepted[path]
+                continue
+            affected |= self._query_ids(self._frames.get(path, (None, None)))
+            affected |= self._query_ids(frames)
+            self._frames[path] = frames
+            if self.store is not None:
+                self.store.upsert_workbook(path, *frames)
+
+        for path in removed:
+            affected |= self._query_ids(self._frames.pop(path, (None, None)))
+
+        if self.store is not None:
+            self.store.sync_workbooks(list(accepted))
+        self.manifest = accepted
+        logging.info("Re-ingested %d workbooks, removed %d, %d queries affected",
+                     len(changed), len(removed), len(affected))
+        return affected
+
+    def feedback(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Combine the cached workbooks in manifest order.
+
+        Returns:
+            Tuple[pd.DataFrame, pd.DataFrame]: (QA data, reference data) with the dtype policy applied
+        """
+        qa_frames = [self._frames[path][0] for path in self.manifest
+                     if path in self._frames and self._frames[path][0] is not None]
+        ref_frames = [self._frames[path][1] for path in self.manifest
+                      if path in self._frames and self._frames[path][1] is not None]
+        combined_qa = pd.concat(qa_frames, ignore_index=True) if qa_frames else pd.DataFrame()
+        combined_ref = pd.concat(ref_frames, ignore_index=True) if ref_frames else pd.DataFrame()
+        return dtype_policy.apply_dtype_policy(combined_qa), dtype_policy.apply_dtype_policy(combined_ref)
+
+    def sources(self) -> List[feedback_data.WorkbookSource]:
+        """
+        Workbook sources of the QA data returned by feedback, in its row order.
+        """
+        return [feedback_data.workbook_source(path, self._frames[path][0])
+                for path in self.manifest if path in self._frames]
@@ -8,6 +8,9 @@ query responses, and transformed feedback data.
 # Third-party library
 import pandas as pd
 
+# Custom/User-defined module
+import dtype_policy
+
 # Built-in library
 from typing import Any
 from statistics import mode
@@ -112,6 +115,7 @@ def generate_query_status(review_status: pd.DataFrame,
         # Add query to existing review status file
         required_columns = ['Query ID', 'Query', 'Review status', 'SMEs_reviewed', 
                           'SMEs_yet_to_review', 'SMEs_unable_to_review']
+        review_status, query_output = dtype_policy.match_key_dtype(review_status, query_output, 'Query ID', 'query_id')
         query_status = review_status.merge(query_output, how='left', on='Query ID')
         query_status = query_status[required_columns]
         
@@ -133,8 +137,7 @@ def get_full_feedback(full_feedback: pd.DataFrame,
                           'Clinical Harmfulness', 'Clinical Harmfulness Level', 'Notes']
         print(full_feedback.columns)
         publication_queries = list(publication_queries['query_id'])
-        full_feedback = full_feedback[full_feedback['Query ID'].isin(publication_queries)]
-        full_feedback = full_feedback[required_columns]
+        full_feedback = full_feedback.loc[full_feedback['Query ID'].isin(publication_queries), required_columns]
         return full_feedback
 
     except Exception as e:
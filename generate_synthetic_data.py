@@ -0,0 +1,492 @@
+"""
+generate_synthetic_data.py
+
+This module generates a synthetic evaluation corpus for scale testing.
+It writes SME feedback workbooks and the input files expected by main.py
+using only local files, so the pipeline can be exercised without clinical data.
+
+Dependencies:
+    - pandas
+    - openpyxl
+    - numpy
+"""
+
+# Third-party libraries
+import pandas as pd
+import openpyxl as xl
+import numpy as np
+
+# Built-in libraries
+import os
+import random
+import argparse
+from typing import Dict, List, Optional
+
+# Agreement patterns and the number of SMEs that rate the query
+PATTERN_RATERS = {
+    'agree2': 2,
+    'disagree2': 2,
+    'missing_md': 2,
+    'agree3': 3,
+    'mode3': 3,
+    'disagree3': 3,
+    'consensus': 3,
+    'single': 1,
+    'unreviewed': 2
+}
+
+DEFAULT_PATTERN_MIX = {
+    'agree2': 0.40,
+    'disagree2': 0.10,
+    'missing_md': 0.05,
+    'agree3': 0.10,
+    'mode3': 0.10,
+    'disagree3': 0.05,
+    'consensus': 0.05,
+    'single': 0.05,
+    'unreviewed': 0.10
+}
+
+FEEDBACK_COLUMNS = [
+    'Query ID', 'Query', 'Response URL', 'Response', 'Unable to Review',
+    'Overall Answer Helpfulness', 'Comprehension', 'Correctness', 'Completeness',
+    'Clinical Harmfulness', 'Clinical Harmfulness Level', 'Notes'
+]
+
+REFERENCE_COLUMNS = ['Query ID', 'Reference Title', 'Reference URL']
+
+OUTPUT_COLUMNS = [
+    'Query ID', 'Query', 'Processed Query', 'Status', 'Response ID',
+    'Response', 'Additional Information', 'Response Time'
+]
+
+METADATA_COLUMNS = [
+    'query_id', 'query', 'source', 'specialties', 'speciality_routing',
+    'sex_at_birth', 'age_categories', 'special_populations',
+    'sensitive_topics', 'query_type'
+]
+
+# Workbook cell labels per dimension, keyed by the score they collapse to
+DIMENSION_LABELS = {
+    'Overall Answer Helpfulness': {'0': ' 🙁', '1': ' 😐', '2': ' 😀'},
+    'Comprehension': {
+        '0': '0 -- Not understood',
+        '1': '1 -- Somewhat comprehended',
+        '2': '2 -- Completely comprehended'
+    },
+    'Correctness': {
+        '0': '0 -- Completely incorrect',
+        '1': '1 -- Mostly incorrect',
+        '2': '2 -- Equally correct and incorrect',
+        '3': '3 -- Mostly correct',
+        '4': '4 -- Completely correct'
+    },
+    'Completeness': {
+        '0': '0 -- Incomplete',
+        '1': '1 -- Adequate',
+        '2': '2 -- Comprehensive'
+    },
+    'Clinical Harmfulness': {'0': '0 -- No harm', '1': '1 -- Any harm'},
+    'Clinical Harmfulness Level': {
+        '0': '0 -- Death',
+        '1': '1 -- Severe harm',
+        '2': '2 -- Moderate harm',
+        '3': '3 -- Mild harm',
+        '4': '4 -- No harm'
+    }
+}
+
+DIMENSIONS = list(DIMENSION_LABELS.keys())
+
+# Dimensions with at least three scores, used to create disagreement
+SPLIT_DIMENSIONS = ['Overall Answer Helpfulness', 'Comprehension', 'Correctness', 'Completeness']
+
+METADATA_VALUES = {
+    'source': ['patient portal', 'clinician survey', 'call center'],
+    'specialties': ['Cardiology', 'Oncology', 'Pediatrics', 'Endocrinology', 'Primary Care'],
+    'speciality_routing': ['routed', 'not routed'],
+    'sex_at_birth': ['Female', 'Male', 'Not specified'],
+    'age_categories': ['Pediatric', 'Adult', 'Geriatric'],
+    'special_populations': ['None', 'Pregnancy', 'Immunocompromised'],
+    'sensitive_topics': ['No', 'Yes'],
+    'query_type': ['Diagnosis', 'Treatment', 'Medication', 'Prevention', 'General']
+}
+
+CREDENTIALS_MD = ['MD', 'DO']
+CREDENTIALS_OTHER = ['RN', 'NP', 'PA', 'PharmD']
+FAILED_STATUSES = ['Error', 'Timeout', 'Content Filtered']
+
+WORDS = [
+    'patient', 'dose', 'symptom', 'therapy', 'risk', 'clinical', 'guideline',
+    'treatment', 'condition', 'monitor', 'blood', 'pressure', 'follow', 'care',
+    'medication', 'daily', 'reduce', 'evidence', 'recommend', 'provider'
+]
+
+
+def setup_args() -> argparse.ArgumentParser:
+    """
+    Setup command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Generate a synthetic evaluation corpus.')
+    parser.add_argument(
+        'feedback_directory',
+        type=str,
+        help='Directory to write the SME feedback workbooks.'
+    )
+    parser.add_argument(
+        'input_directory',
+        type=str,
+        help='Directory to write query metadata, publication, query output and SME master files.'
+    )
+    parser.add_argument('--queries', type=int, default=1000, help='Number of queries.')
+    parser.add_argument('--smes', type=int, default=20, help='Number of SMEs.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+    parser.add_argument(
+        '--queries-per-workbook',
+        type=int,
+        default=50,
+        help='Maximum number of feedback rows per workbook.'
+    )
+    parser.add_argument('--failed-rate', type=float, default=0.02, help='Fraction of failed responses.')
+    parser.add_argument('--unable-rate', type=float, default=0.05,
+                        help='Fraction of queries with an extra unable-to-review SME.')
+    parser.add_argument('--response-words', type=int, default=60, help='Average words per response.')
+    parser.add_argument(
+        '--mix',
+        type=str,
+        default=None,
+        help='Agreement pattern mix, e.g. agree2=0.5,disagree2=0.2,single=0.3'
+    )
+    return parser
+
+
+def parse_pattern_mix(mix: Optional[str]) -> Dict[str, float]:
+    """
+    Parse an agreement pattern mix string.
+
+    Args:
+        mix (Optional[str]): Comma-separated pattern=weight pairs
+
+    Returns:
+        Dict[str, float]: Normalized pattern weights
+    """
+    if not mix:
+        weights = dict(DEFAULT_PATTERN_MIX)
+    else:
+        weights = {}
+        for item in mix.split(','):
+            name, value = item.split('=')
+            name = name.strip()
+            if name not in PATTERN_RATERS:
+                raise ValueError(f"Unknown agreement pattern '{name}'")
+            weights[name] = float(value)
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("Agreement pattern weights must sum to a positive value")
+    return {name: value / total for name, value in weights.items()}
+
+
+def _random_text(rng: np.random.Generator, n: int, words: int) -> List[str]:
+    """
+    Build n pseudo-random sentences of about the given number of words.
+    """
+    lengths = np.maximum(1, rng.poisson(words, size=n))
+    tokens = rng.integers(0, len(WORDS), size=int(lengths.sum()))
+    vocab = np.array(WORDS, dtype=object)[tokens]
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    return [' '.join(vocab[s:e]) for s, e in zip(starts, ends)]
+
+
+def _rate_query(pattern: str, n_raters: int, rng: random.Random) -> List[Dict[str, str]]:
+    """
+    Build the per-SME dimension scores for a query following an agreement pattern.
+    """
+    base = {dim: rng.choice(list(DIMENSION_LABELS[dim])) for dim in DIMENSIONS}
+    if base['Clinical Harmfulness'] == '0':
+        base['Clinical Harmfulness Level'] = '4'
+    else:
+        base['Clinical Harmfulness Level'] = rng.choice(['0', '1', '2', '3'])
+    ratings = [dict(base) for _ in range(n_raters)]
+
+    if pattern in ('disagree2', 'mode3'):
+        dim = rng.choice(SPLIT_DIMENSIONS)
+        other = [s for s in DIMENSION_LABELS[dim] if s != base[dim]]
+        ratings[-1][dim] = rng.choice(other)
+    elif pattern in ('disagree3', 'consensus'):
+        dim = rng.choice(SPLIT_DIMENSIONS)
+        scores = rng.sample(list(DIMENSION_LABELS[dim]), 3)
+        for rating, score in zip(ratings, scores):
+            rating[dim] = score
+    return ratings
+
+
+def build_corpus(n_queries: int = 1000,
+                 n_smes: int = 20,
+                 seed: int = 0,
+                 failed_rate: float = 0.02,
+                 unable_rate: float = 0.05,
+                 na_rate: float = 0.02,
+                 md_fraction: float = 0.4,
+                 ready_fraction: float = 0.95,
+                 response_words: int = 60,
+                 pattern_mix: Optional[Dict[str, float]] = None) -> Dict[str, pd.DataFrame]:
+    """
+    Build a synthetic evaluation corpus in memory.
+
+    Args:
+        n_queries (int): Number of publication queries
+        n_smes (int): Number of SMEs in the master list
+        seed (int): Random seed, the corpus is fully determined by it
+        failed_rate (float): Fraction of queries with a failed model response
+        unable_rate (float): Fraction of queries with an extra unable-to-review SME
+        na_rate (float): Fraction of ratings marked n/a for Correctness and Completeness
+        md_fraction (float): Fraction of SMEs with MD or DO credentials
+        ready_fraction (float): Fraction of SMEs ready for evaluation
+        response_words (int): Average number of words per response
+        pattern_mix (Optional[Dict[str, float]]): Agreement pattern weights
+
+    Returns:
+        Dict[str, pd.DataFrame]: Frames keyed by feedback, references, sme_master,
+            publication, query_metadata, query_output, query_output_references
+            and query_failed. The feedback frame matches load_raw_feedback output.
+    """
+    if n_smes < 4:
+        raise ValueError("At least 4 SMEs are needed to cover every agreement pattern")
+    mix = pattern_mix if pattern_mix is not None else dict(DEFAULT_PATTERN_MIX)
+    total = sum(mix.values())
+    patterns = list(mix.keys())
+    weights = np.array([mix[p] for p in patterns], dtype=float) / total
+
+    rng = np.random.default_rng(seed)
+    picker = random.Random(seed)
+
+    # SME master list, the first SMEs are always ready so every pattern can be staffed
+    sme_ids = np.arange(1, n_smes + 1)
+    n_md = max(2, int(round(n_smes * md_fraction)))
+    credentials = [picker.choice(CREDENTIALS_MD) if i < n_md else picker.choice(CREDENTIALS_OTHER)
+                   for i in range(n_smes)]
+    ready = rng.random(n_smes) < ready_fraction
+    ready[:4] = True
+    ready[n_md:n_md + 2] = True
+    sme_master = pd.DataFrame({
+        'Id': sme_ids,
+        'ID': [f'EVAL-{i:03d}' for i in sme_ids],
+        'Status_Ready for Evaluation': np.where(ready, 'Yes', 'No'),
+        'Please specify your clinical credentials': credentials
+    })
+    md_pool = [code for code, c, r in zip(sme_master['ID'], credentials, ready) if r and c in CREDENTIALS_MD]
+    other_pool = [code for code, c, r in zip(sme_master['ID'], credentials, ready) if r and c not in CREDENTIALS_MD]
+    all_pool = md_pool + other_pool
+
+    # Queries, metadata and model responses
+    query_ids = [f'Q{i:07d}' for i in range(1, n_queries + 1)]
+    query_text = _random_text(rng, n_queries, 12)
+    publication = pd.DataFrame({'query_id': query_ids, 'query': query_text})
+    for column in METADATA_COLUMNS[2:]:
+        values = METADATA_VALUES[column]
+        publication[column] = np.array(values, dtype=object)[rng.integers(0, len(values), n_queries)]
+    query_metadata = publication.copy()
+
+    failed = rng.random(n_queries) < failed_rate
+    response_ids = [f'R{i:07d}' for i in range(1, n_queries + 1)]
+    responses = _random_text(rng, n_queries, response_words)
+    response_time = np.round(rng.lognormal(mean=1.2, sigma=0.5, size=n_queries), 3)
+    status = np.where(failed,
+                      np.array(FAILED_STATUSES, dtype=object)[rng.integers(0, len(FAILED_STATUSES), n_queries)],
+                      'Success')
+    output = pd.DataFrame({
+        'Query ID': query_ids,
+        'Query': query_text,
+        'Processed Query': [q.capitalize() for q in query_text],
+        'Status': status,
+        'Response ID': response_ids,
+        'Response': np.where(failed, '', np.array(responses, dtype=object)),
+        'Additional Information': '',
+        'Response Time': response_time
+    })
+    query_output = output[~failed].reset_index(drop=True)
+    query_failed = output[failed].reset_index(drop=True)
+
+    n_refs = rng.integers(1, 5, n_queries)
+    ref_query = np.repeat(np.arange(n_queries), n_refs)
+    ref_source = rng.zipf(1.6, size=len(ref_query)) % 5000
+    output_references = pd.DataFrame({
+        'Query ID': np.array(query_ids, dtype=object)[ref_query],
+        'Reference Title': [f'Clinical source {s}' for s in ref_source],
+        'Reference URL': [f'https://example.org/source/{s}' for s in ref_source]
+    })
+    output_references = output_references[~failed[ref_query]].reset_index(drop=True)
+
+    # SME feedback rows
+    query_pattern = np.array(patterns, dtype=object)[rng.choice(len(patterns), size=n_queries, p=weights)]
+    unable = rng.random(n_queries) < unable_rate
+    rows = []
+    ref_rows = []
+    for i in np.flatnonzero(~failed):
+        pattern = query_pattern[i]
+        n_raters = PATTERN_RATERS[pattern]
+        if pattern == 'missing_md':
+            smes = picker.sample(other_pool, n_raters)
+        else:
+            md = picker.choice(md_pool)
+            smes = [md] + picker.sample([s for s in all_pool if s != md], n_raters - 1) if n_raters > 1 else [md]
+        qid = query_ids[i]
+        common = {
+            'Query ID': qid,
+            'Query': query_text[i],
+            'Response URL': f'https://example.org/responses/{response_ids[i]}',
+            'Response': responses[i]
+        }
+        if pattern == 'unreviewed':
+            ratings = [{dim: None for dim in DIMENSIONS} for _ in smes]
+        else:
+            ratings = _rate_query(pattern, n_raters, picker)
+        for sme, rating in zip(smes, ratings):
+            row = dict(common)
+            row['Unable to Review'] = None
+            for dim in DIMENSIONS:
+                score = rating[dim]
+                if score is not None and dim in ('Correctness', 'Completeness') and picker.random() < na_rate:
+                    row[dim] = 'n/a'
+                else:
+                    row[dim] = DIMENSION_LABELS[dim][score] if score is not None else None
+            row['Notes'] = None if picker.random() < 0.7 else ' '.join(picker.sample(WORDS, 5))
+            row['SME'] = sme
+            rows.append(row)
+        if pattern == 'consensus':
+            row = dict(common)
+            row['Unable to Review'] = None
+            for dim in DIMENSIONS:
+                row[dim] = DIMENSION_LABELS[dim][ratings[0][dim]]
+            row['Notes'] = 'Agreed by email'
+            row['SME'] = 'EVAL-consensus'
+            rows.append(row)
+        if unable[i]:
+            spare = [s for s in all_pool if s not in smes]
+            if spare:
+                row = dict(common)
+                row['Unable to Review'] = 'X'
+                for dim in DIMENSIONS:
+                    row[dim] = None
+                row['Notes'] = 'Outside my specialty'
+                row['SME'] = picker.choice(spare)
+                rows.append(row)
+        for sme in smes:
+            ref_rows.append({'Query ID': qid, 'SME': sme})
+
+    feedback = pd.DataFrame(rows, columns=FEEDBACK_COLUMNS + ['SME'])
+    sme_refs = pd.DataFrame(ref_rows, columns=['Query ID', 'SME'])
+    references = sme_refs.merge(output_references, on='Query ID', how='inner')
+    references = references[REFERENCE_COLUMNS + ['SME']]
+
+    return {
+        'feedback': feedback,
+        'references': references,
+        'sme_master': sme_master,
+        'publication': publication,
+        'query_metadata': query_metadata,
+        'query_output': query_output,
+        'query_output_references': output_references,
+        'query_failed': query_failed
+    }
+
+
+def _write_sheet(book: xl.Workbook, name: str, frame: pd.DataFrame, title: Optional[str] = None):
+    """
+    Append a frame to a write-only workbook, optionally under a title row.
+    """
+    sheet = book.create_sheet(name)
+    if title is not None:
+        sheet.append([title])
+    sheet.append(list(frame.columns))
+    for row in frame.itertuples(index=False, name=None):
+        sheet.append([None if isinstance(v, float) and np.isnan(v) else v for v in row])
+
+
+def write_feedback_workbooks(feedback: pd.DataFrame,
+                             references: pd.DataFrame,
+                             feedback_directory: str,
+                             queries_per_workbook: int = 50) -> List[str]:
+    """
+    Write feedback rows as feedback*.xlsm workbooks, one folder per SME.
+
+    Args:
+        feedback (pd.DataFrame): Feedback rows with an SME column
+        references (pd.DataFrame): Reference rows with an SME column
+        feedback_directory (str): Root directory for the workbooks
+        queries_per_workbook (int): Maximum number of feedback rows per workbook
+
+    Returns:
+        List[str]: Paths of the written workbooks
+    """
+    paths = []
+    ref_groups = {sme: df for sme, df in references.groupby('SME', sort=False)}
+    for sme, sme_feedback in feedback.groupby('SME', sort=True):
+        sme_dir = os.path.join(feedback_directory, sme)
+        os.makedirs(sme_dir, exist_ok=True)
+        sme_refs = ref_groups.get(sme, pd.DataFrame(columns=REFERENCE_COLUMNS + ['SME']))
+        for batch, start in enumerate(range(0, len(sme_feedback), queries_per_workbook), start=1):
+            chunk = sme_feedback.iloc[start:start + queries_per_workbook]
+            chunk_refs = sme_refs[sme_refs['Query ID'].isin(chunk['Query ID'])]
+            book = xl.Workbook(write_only=True)
+            _write_sheet(book, 'Feedback', chunk[FEEDBACK_COLUMNS], title=f'SME feedback form - {sme}')
+            _write_sheet(book, 'References', chunk_refs[REFERENCE_COLUMNS])
+            path = os.path.join(sme_dir, f'feedback_{sme}_batch-{batch:04d}.xlsm')
+            book.save(path)
+            paths.append(path)
+    return paths
+
+
+def write_corpus(corpus: Dict[str, pd.DataFrame],
+                 feedback_directory: str,
+                 input_directory: str,
+                 queries_per_workbook: int = 50) -> List[str]:
+    """
+    Write a synthetic corpus to the directory layout main.py expects.
+
+    Args:
+        corpus (Dict[str, pd.DataFrame]): Frames returned by build_corpus
+        feedback_directory (str): Directory for the SME feedback workbooks
+        input_directory (str): Directory for the input files
+        queries_per_workbook (int): Maximum number of feedback rows per workbook
+
+    Returns:
+        List[str]: Paths of the written feedback workbooks
+    """
+    os.makedirs(feedback_directory, exist_ok=True)
+    os.makedirs(input_directory, exist_ok=True)
+
+    corpus['sme_master'].to_excel(os.path.join(input_directory, 'sme_jira_master.xlsx'), index=False)
+    corpus['query_metadata'].to_excel(os.path.join(input_directory, 'query_metadata_initial.xlsx'), index=False)
+    corpus['query_failed'].to_excel(os.path.join(input_directory, 'query_output-initial-failed.xlsx'), index=False)
+
+    book = xl.Workbook(write_only=True)
+    _write_sheet(book, 'Publication query list', corpus['publication'])
+    book.save(os.path.join(input_directory, 'Publication.xlsx'))
+
+    book = xl.Workbook(write_only=True)
+    _write_sheet(book, 'Queries', corpus['query_output'])
+    _write_sheet(book, 'References', corpus['query_output_references'])
+    book.save(os.path.join(input_directory, 'query_output-initial.xlsx'))
+
+    return write_feedback_workbooks(corpus['feedback'], corpus['references'],
+                                    feedback_directory, queries_per_workbook)
+
+
+if __name__ == "__main__":
+    parser = setup_args()
+    args = parser.parse_args()
+
+    corpus = build_corpus(
+        n_queries=args.queries,
+        n_smes=args.smes,
+        seed=args.seed,
+        failed_rate=args.failed_rate,
+        unable_rate=args.unable_rate,
+        response_words=args.response_words,
+        pattern_mix=parse_pattern_mix(args.mix)
+    )
+    paths = write_corpus(corpus, args.feedback_directory, args.input_directory, args.queries_per_workbook)
+    print(f"Wrote {len(corpus['publication'])} queries, {len(corpus['feedback'])} feedback rows "
+          f"and {len(paths)} workbooks")
@@ -0,0 +1,353 @@
+"""
+latency_analytics.py
+
+This module reports model response latency and failure rates, overall and
+per publication metadata stratum, as a companion to stats.xlsx. Latency
+quantiles (p50/p90/p99 of Response Time) come from mergeable log-bucket
+sketches in the style of DDSketch: a value x goes to bucket ceil(log_gamma x)
+with gamma = (1 + a) / (1 - a), so every reported quantile is within relative
+accuracy a of the exact one while a sketch only keeps one counter per
+occupied bucket. Sketches of two runs, or of two chunks of one run, merge by
+adding bucket counts, so multi-run results never need the responses again.
+
+Dependencies:
+    - pandas
+    - numpy
+"""
+
+# Third-party library
+import pandas as pd
+import numpy as np
+
+# Built-in library
+import json
+import math
+import logging
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+STRATUM_COLUMNS = ['specialties', 'query_type']
+
+QUANTILES = [0.5, 0.9, 0.99]
+
+RELATIVE_ACCURACY = 0.01
+
+SUCCESS_STATUS = 'Success'
+
+# Response times at or below this many seconds are counted as zero
+MIN_INDEXABLE = 1e-6
+
+ALL = 'All'
+
+
+def setup_args() -> argparse.ArgumentParser:
+    """
+    Setup command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Merge latency sketches of several runs into one report.')
+    parser.add_argument('out_file', type=str, help='Excel file to write the merged latency report to.')
+    parser.add_argument('sketch_files', type=str, nargs='+', help='latency_sketches.json files to merge.')
+    return parser
+
+
+class LatencySketch:
+    """
+    Mergeable quantile sketch with relative accuracy guarantees.
+    """
+
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def bucket_index(self, values: np.ndarray) -> np.ndarray:
+        """
+        Bucket index of positive values.
+        """
+        return np.ceil(np.log(values) / self.log_gamma).astype(np.int64)
+
+    def add_buckets(self, indexes: np.ndarray, counts: np.ndarray):
+        """
+        Add counts to buckets, indexes as returned by bucket_index.
+        """
+        for index, count in zip(indexes.tolist(), counts.tolist()):
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def add(self, values: np.ndarray):
+        """
+        Add a batch of non-negative values.
+
+        Args:
+            values (np.ndarray): Values, NaN and negative values are ignored
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[values >= 0]
+        if not len(values):
+            return
+        positive = values > MIN_INDEXABLE
+        indexes, counts = np.unique(self.bucket_index(values[positive]), return_counts=True)
+        self.add_buckets(indexes, counts)
+        self.zero_count += int((~positive).sum())
+        self.record_summary(len(values), float(values.sum()), float(values.min()), float(values.max()))
+
+    def record_summary(self, count: int, total: float, minimum: float, maximum: float):
+        """
+        Update the count, sum and range after buckets were added.
+        """
+        self.count += count
+        self.total += total
+        self.min = min(self.min, minimum)
+        self.max = max(self.max, maximum)
+
+    def merge(self, other: 'LatencySketch'):
+        """
+        Add the values of another sketch with the same relative accuracy.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Sketches with different relative accuracy cannot be merged")
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        if other.count:
+            self.record_summary(other.count, other.total, other.min, other.max)
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile, NaN for an empty sketch.
+
+        Args:
+            q (float): Quantile between 0 and 1
+
+        Returns:
+            float: Value within the relative accuracy of the exact quantile
+        """
+        if not self.count:
+            return math.nan
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        """
+        JSON serializable state of the sketch.
+        """
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'buckets': {str(index): count for index, count in self.buckets.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'total': self.total,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'LatencySketch':
+        """
+        Rebuild a sketch from to_dict output.
+        """
+        sketch = cls(state['relative_accuracy'])
+        sketch.buckets = {int(index): count for index, count in state['buckets'].items()}
+        sketch.zero_count = state['zero_count']
+        sketch.count = state['count']
+        sketch.total = state['total']
+        if sketch.count:
+            sketch.min, sketch.max = state['min'], state['max']
+        return sketch
+
+
+class LatencyStats:
+    """
+    Latency sketches and response status counts per metadata stratum value.
+
+    Groups are keyed by (stratum column, value); the 'All' group covers every
+    response. Latency covers all responses with a Response Time, failed ones
+    included, since a timeout is part of the latency users see.
+    """
+
+    def __init__(self, strata: Optional[List[str]] = None, relative_accuracy: float = RELATIVE_ACCURACY):
+        self.strata = list(STRATUM_COLUMNS if strata is None else strata)
+        self.relative_accuracy = relative_accuracy
+        self.sketches: Dict[Tuple[str, str], LatencySketch] = {}
+        self.status_counts: Dict[Tuple[str, str], Dict[str, int]] = {}
+
+    def sketch(self, key: Tuple[str, str]) -> LatencySketch:
+        """
+        Sketch of a group, created empty on first use.
+        """
+        if key not in self.sketches:
+            self.sketches[key] = LatencySketch(self.relative_accuracy)
+        return self.sketches[key]
+
+    def update(self, responses: pd.DataFrame, publication: pd.DataFrame):
+        """
+        Add a batch of query responses.
+
+        Bucket indexes are computed once for the batch and each stratum is
+        one unique count over (level, bucket) codes.
+
+        Args:
+            responses (pd.DataFrame): Query responses with Query ID, Status and Response Time,
+                as from generate_queryResponse_reference
+            publication (pd.DataFrame): Publication query list with the stratum columns
+        """
+        if responses.empty:
+            return
+        metadata = publication.drop_duplicates('query_id').set_index('query_id')
+        query_ids = responses['Query ID'].astype(str)
+        times = pd.to_numeric(responses['Response Time'], errors='coerce').to_numpy(dtype=float)
+        status = responses['Status'].astype(str).to_numpy()
+        timed = times >= 0
+        positive = timed & (times > MIN_INDEXABLE)
+        indexes = np.zeros(len(times), dtype=np.int64)
+        scratch = LatencySketch(self.relative_accuracy)
+        indexes[positive] = scratch.bucket_index(times[positive])
+        low = int(indexes[positive].min()) if positive.any() else 0
+        span = int(indexes[positive].max()) - low + 1 if positive.any() else 1
+
+        metadata.index = metadata.index.astype(str)
+        groups = [(ALL, np.zeros(len(times), dtype=np.int64), pd.Index([ALL]))]
+        for stratum in self.strata:
+            if stratum in metadata:
+                values = query_ids.map(metadata[stratum].astype(str).where(metadata[stratum].notna()))
+                codes, levels = pd.factorize(values, sort=True)
+                groups.append((stratum, codes, levels))
+
+        for stratum, codes, levels in groups:
+            grouped = codes >= 0
+            # Buckets of all levels from one unique count over (level, bucket)
+            keys = codes[grouped & positive] * span + (indexes[grouped & positive] - low)
+            pairs, counts = np.unique(keys, return_counts=True)
+            pair_levels, pair_buckets = np.divmod(pairs, span)
+            for level in np.unique(codes[grouped]):
+                key = (stratum, str(levels[level]))
+                sketch = self.sketch(key)
+                selected = pair_levels == level
+                sketch.add_buckets(pair_buckets[selected] + low, counts[selected])
+                level_times = times[(codes == level) & timed]
+                if len(level_times):
+                    sketch.zero_count += int((level_times <= MIN_INDEXABLE).sum())
+                    sketch.record_summary(len(level_times), float(level_times.sum()),
+                                          float(level_times.min()), float(level_times.max()))
+                level_status = pd.Series(status[codes == level]).value_counts()
+                counts_by_status = self.status_counts.setdefault(key, {})
+                for name, count in level_status.items():
+                    counts_by_status[name] = counts_by_status.get(name, 0) + int(count)
+
+    def merge(self, other: 'LatencyStats'):
+        """
+        Add the sketches and status counts of another run or batch.
+        """
+        for key, sketch in other.sketches.items():
+            self.sketch(key).merge(sketch)
+        for key, counts in other.status_counts.items():
+            merged = self.status_counts.setdefault(key, {})
+            for name, count in counts.items():
+                merged[name] = merged.get(name, 0) + count
+
+    def tables(self) -> Dict[str, pd.DataFrame]:
+        """
+        Report tables.
+
+        Returns:
+            Dict[str, pd.DataFrame]: 'Latency' with n, quantiles, mean, max and failure rate per group,
+                'Status' with the count and rate of each response status per group
+        """
+        keys = sorted(set(self.sketches) | set(self.status_counts), key=lambda key: (key[0] != ALL, key))
+        latency = []
+        status = []
+        for stratum, value in keys:
+            sketch = self.sketches.get((stratum, value), LatencySketch(self.relative_accuracy))
+            counts = self.status_counts.get((stratum, value), {})
+            responses = sum(counts.values())
+            failed = responses - counts.get(SUCCESS_STATUS, 0)
+            row = {'stratum': stratum, 'stratum_value': value, 'responses': responses, 'n_timed': sketch.count}
+            for q in QUANTILES:
+                row[f'p{int(round(q * 100))}'] = round(sketch.quantile(q), 3)
+            row['mean'] = round(sketch.total / sketch.count, 3) if sketch.count else math.nan
+            row['max'] = round(sketch.max, 3) if sketch.count else math.nan
+            row['failure_rate'] = round(failed / responses * 100, 2) if responses else math.nan
+            latency.append(row)
+            for name in sorted(counts):
+                status.append({'stratum': stratum, 'stratum_value': value, 'Status': name,
+                               'count': counts[name], 'percentage': round(counts[name] / responses * 100, 2)})
+        return {'Latency': pd.DataFrame(latency), 'Status': pd.DataFrame(status)}
+
+    def to_json(self) -> str:
+        """
+        Serialize the sketches and status counts.
+        """
+        return json.dumps({
+            'strata': self.strata,
+            'relative_accuracy': self.relative_accuracy,
+            'groups': [
+                {'stratum': stratum, 'value': value,
+                 'sketch': self.sketches[(stratum, value)].to_dict() if (stratum, value) in self.sketches else None,
+                 'status': self.status_counts.get((stratum, value), {})}
+                for stratum, value in sorted(set(self.sketches) | set(self.status_counts))
+            ]
+        })
+
+    @classmethod
+    def from_json(cls, text: str) -> 'LatencyStats':
+        """
+        Rebuild stats from to_json output.
+        """
+        state = json.loads(text)
+        stats = cls(state['strata'], state['relative_accuracy'])
+        for group in state['groups']:
+            key = (group['stratum'], group['value'])
+            if group['sketch'] is not None:
+                stats.sketches[key] = LatencySketch.from_dict(group['sketch'])
+            stats.status_counts[key] = dict(group['status'])
+        return stats
+
+
+def latency_stats(responses: pd.DataFrame, publication: pd.DataFrame,
+                  strata: Optional[List[str]] = None) -> LatencyStats:
+    """
+    Build the latency stats of one run.
+
+    Args:
+        responses (pd.DataFrame): Query responses from generate_queryResponse_reference
+        publication (pd.DataFrame): Publication query list
+        strata (Optional[List[str]]): Stratum columns, STRATUM_COLUMNS by default
+
+    Returns:
+        LatencyStats: Stats of the run
+    """
+    stats = LatencyStats(strata)
+    stats.update(responses, publication)
+    return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = setup_args()
+    args = parser.parse_args()
+
+    merged = None
+    for path in args.sketch_files:
+        with open(path) as handle:
+            stats = LatencyStats.from_json(handle.read())
+        if merged is None:
+            merged = stats
+        else:
+            merged.merge(stats)
+    with pd.ExcelWriter(args.out_file) as writer:
+        for sheet, frame in merged.tables().items():
+            frame.to_excel(writer, sheet_name=sheet, index=False)
+    logging.info('Merged %d latency sketch files into %s', len(args.sketch_files), args.out_file)
@@ -13,12 +13,20 @@ import logging
 from os import makedirs
 import warnings
 import traceback
+from typing import Optional
 
 # Custom/User-defined module
 import feedback_data
 import process_query
 import generate_datafiles
 import generate_aggregateScore
+import output_writer
+import dtype_policy
+import evaluation_store
+import feedback_watch
+import shared_data
+import validation
+import latency_analytics
 
 # Third-party library
 import pandas as pd
@@ -45,6 +53,60 @@ def setup_args() -> argparse.ArgumentParser:
         type=str, 
         help='Directory to store all data files'
     )
+    parser.add_argument(
+        '--intermediate-format',
+        type=str,
+        default='parquet',
+        choices=output_writer.INTERMEDIATE_FORMATS,
+        help='Format of the intermediate files written to the feedback directory, none to skip them.'
+    )
+    parser.add_argument(
+        '--store',
+        type=str,
+        default=None,
+        help='SQLite evaluation store, only new or changed feedback workbooks are parsed into it.'
+    )
+    parser.add_argument(
+        '--writer-workers',
+        type=int,
+        default=4,
+        help='Number of workers writing output files in the background, 0 to write inline.'
+    )
+    parser.add_argument(
+        '--writer-pool',
+        type=str,
+        default='process',
+        choices=output_writer.WRITER_POOLS,
+        help='Run the writer workers as processes or threads.'
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='Keep running and re-evaluate the affected queries when feedback workbooks change.'
+    )
+    parser.add_argument(
+        '--poll-interval',
+        type=float,
+        default=5.0,
+        help='Seconds between checks of the feedback directory in watch mode.'
+    )
+    parser.add_argument(
+        '--debounce',
+        type=float,
+        default=10.0,
+        help='Seconds without further changes before a watch mode refresh starts.'
+    )
+    parser.add_argument(
+        '--skip-validation',
+        action='store_true',
+        help='Do not stop on feedback validation issues (missing columns, unknown scores or SMEs, duplicates).'
+    )
+    parser.add_argument(
+        '--stage-workers',
+        type=int,
+        default=0,
+        help='Shard the review status and transform stages over worker processes sharing the ratings, 0 to run inline.'
+    )
     
     return parser
     
@@ -71,6 +133,22 @@ def load_sme_master_list(input_directory: str):
         print(f"Error: SME master list not found at {sme_path}")
         return None, None
 
+def load_query_output(input_directory: str, run: str = 'initial'):
+    """
+    Load the query output and failed output files of one model response run.
+
+    Args:
+        input_directory (str): Directory containing the input files
+        run (str): Run name, the files are query_output-<run>.xlsx and query_output-<run>-failed.xlsx
+    Returns:
+        tuple: (query_feedback, query_reference, query_failed) DataFrames
+    """
+    with pd.ExcelFile(os.path.join(input_directory, f'query_output-{run}.xlsx')) as book:
+        query_feedback = book.parse(sheet_name='Queries')
+        query_reference = book.parse(sheet_name='References')
+    query_failed = pd.read_excel(os.path.join(input_directory, f'query_output-{run}-failed.xlsx'))
+    return tuple(dtype_policy.apply_dtype_policy(df) for df in (query_feedback, query_reference, query_failed))
+
 def load_all_inputfile(input_directory: str):
     """
     Load all required input files from the specified directory.
@@ -78,10 +156,11 @@ def load_all_inputfile(input_directory: str):
     try:
         print("Loading all input data")
         query_metadata = pd.read_excel(input_directory+'/query_metadata_initial.xlsx')
-        query_feedback = pd.read_excel(input_directory+'/query_output-initial.xlsx', sheet_name='Queries')
-        query_reference = pd.read_excel(input_directory+'/query_output-initial.xlsx', sheet_name='References')
         publication = pd.read_excel(input_directory+'/Publication.xlsx', sheet_name='Publication query list')
-        query_failed = pd.read_excel(input_directory+'/query_output-initial-failed.xlsx')
+
+        # Compact dtypes, IDs share one category set across all frames
+        query_metadata, publication = [dtype_policy.apply_dtype_policy(df) for df in (query_metadata, publication)]
+        query_feedback, query_reference, query_failed = load_query_output(input_directory)
         print("Successfully loaded all data")
         return query_metadata, query_feedback, query_reference, publication, query_failed
     
@@ -90,6 +169,177 @@ def load_all_inputfile(input_directory: str):
         traceback.print_exc()
         return None, None, None, None, None
        
+def convert_feedback(feedback: pd.DataFrame):
+    """
+    Convert the feedback to dimension scores once and derive the subsets by mask.
+
+    Args:
+        feedback (pd.DataFrame): Raw feedback of the publication queries
+    Returns:
+        tuple: (cleaned_feedback, review, review_mask, unable_mask), review holds only
+            the ID and rating columns of the reviewed rows of cleaned_feedback
+    """
+    review_mask = feedback_data.reviewed_mask(feedback)
+    unable_mask = feedback_data.unable_to_review_mask(feedback)
+    cleaned_feedback = feedback_data.convert_to_dimensionscore(feedback)
+    if cleaned_feedback is None:
+        return None, None, None, None
+    review = cleaned_feedback.loc[review_mask, ['SME', 'Query ID'] + feedback_data.DIMENSION_COLUMNS]
+    return cleaned_feedback, review, review_mask, unable_mask
+
+def load_shared_inputs(feedback_directory: str, input_directory: str, validate: bool = True,
+                       issues_file: Optional[str] = None) -> Optional[dict]:
+    """
+    Ingest the publication, SME master and feedback and compute the review status once,
+    for the tools that evaluate them outside the main run (batch runs, calibration).
+
+    Args:
+        feedback_directory (str): Directory with the SME feedback workbooks
+        input_directory (str): Directory containing the input files
+        validate (bool): Validate the feedback as the main run does before the stages run
+        issues_file (Optional[str]): Excel file to write the validation issues to
+
+    Returns:
+        Optional[dict]: publication, sme_ready, cleaned_feedback, review_status and data frames,
+            None when loading or validation failed
+    """
+    publication = pd.read_excel(os.path.join(input_directory, 'Publication.xlsx'),
+                                sheet_name='Publication query list')
+    publication = dtype_policy.apply_dtype_policy(publication)
+    sme_ready, _ = load_sme_master_list(input_directory)
+    if sme_ready is None:
+        return None
+
+    sources = []
+    feedback, _ = feedback_data.load_raw_feedback(feedback_data.get_feedback_files(feedback_directory), None, sources)
+    if feedback is None:
+        return None
+    if validate:
+        issues = validation.validate_feedback(feedback, validation.load_sme_codes(input_directory), sources)
+        if not issues.empty:
+            validation.report_issues(issues, issues_file)
+            return None
+    publication = dtype_policy.align_categories(publication)
+    feedback = feedback[feedback['Query ID'].isin(list(publication['query_id']))]
+
+    cleaned_feedback, review, _, _ = convert_feedback(feedback)
+    if cleaned_feedback is None:
+        return None
+    review_status, data = process_query.get_review_status(review, sme_ready, cleaned_feedback)
+    if review_status is None:
+        return None
+    return {
+        'publication': publication,
+        'sme_ready': sme_ready,
+        'cleaned_feedback': cleaned_feedback,
+        'review_status': review_status,
+        'data': data
+    }
+
+def evaluate_feedback(feedback: pd.DataFrame, sme_ready: pd.DataFrame, publication: pd.DataFrame,
+                      query_output: pd.DataFrame, store=None) -> dict:
+    """
+    Run the evaluation stages on the feedback of the publication queries.
+
+    Args:
+        feedback (pd.DataFrame): Raw feedback of the publication queries
+        sme_ready (pd.DataFrame): SMEs ready for evaluation
+        publication (pd.DataFrame): Publication query list
+        query_output (pd.DataFrame): Query responses from generate_queryResponse_reference
+        store (Optional[EvaluationStore]): Evaluation store for review status lookups
+    Returns:
+        dict: cleaned_feedback, review_status, data, transformed, query_status and stats frames
+    """
+    cleaned_feedback, review, review_mask, unable_mask = convert_feedback(feedback)
+    review_status, data = process_query.get_review_status(review, sme_ready, cleaned_feedback, store)
+    transform_df = generate_datafiles.generate_transformed_file(data, review_status)
+    query_status = generate_datafiles.generate_query_status(review_status, query_output, publication)
+    stats_df = generate_aggregateScore.generate_CIScore(transform_df)
+    return {
+        'cleaned_feedback': cleaned_feedback,
+        'review_status': review_status,
+        'data': data,
+        'transformed': transform_df,
+        'query_status': query_status,
+        'stats': stats_df
+    }
+
+def watch_feedback(cache: feedback_watch.WorkbookCache, results: dict, sme_ready: pd.DataFrame,
+                   publication: pd.DataFrame, query_output: pd.DataFrame, args, store=None):
+    """
+    Re-evaluate the queries touched by changed feedback workbooks until interrupted.
+
+    Only the changed workbooks are parsed again and only the affected queries go
+    through the review status and transformation stages; their rows replace the
+    previous ones in results before the feedback dependent outputs are rewritten.
+
+    Args:
+        cache (WorkbookCache): Parsed workbooks of the initial run
+        results (dict): Frames of the initial run, as returned by evaluate_feedback, and its LatencyStats
+        sme_ready (pd.DataFrame): SMEs ready for evaluation
+        publication (pd.DataFrame): Publication query list
+        query_output (pd.DataFrame): Query responses from generate_queryResponse_reference
+        args: Parsed command line arguments
+        store (Optional[EvaluationStore]): Evaluation store kept in sync with the cache
+    """
+    intermediate_format = output_writer.resolve_intermediate_format(args.intermediate_format)
+    publication_queries = list(publication['query_id'])
+    sme_codes = None if args.skip_validation else validation.load_sme_codes(args.input_directory)
+    # Queries of refreshes held back by invalid feedback
+    pending = set()
+    while True:
+        logging.info('Watching %s for feedback changes', args.feedback_directory)
+        manifest = feedback_watch.wait_for_changes(
+            args.feedback_directory, cache.manifest, args.poll_interval, args.debounce)
+        affected = cache.update(manifest)
+        if not affected:
+            continue
+
+        feedback, _ = cache.feedback()
+        if sme_codes is not None:
+            issues = validation.validate_feedback(feedback, sme_codes, cache.sources())
+            if not issues.empty:
+                validation.report_issues(issues)
+                logging.error('Keeping the previous outputs until the feedback is fixed')
+                pending |= affected
+                continue
+        affected |= pending
+        pending = set()
+        feedback = feedback[feedback['Query ID'].isin(publication_queries)]
+        affected_queries = list(affected)
+        partial = evaluate_feedback(
+            feedback[feedback['Query ID'].isin(affected_queries)],
+            sme_ready,
+            publication[publication['query_id'].isin(affected_queries)],
+            query_output,
+            store
+        )
+        if any(partial[name] is None for name in ('cleaned_feedback', 'review_status', 'transformed', 'query_status')):
+            logging.error('Failed to re-evaluate %d queries, keeping the previous outputs', len(affected))
+            continue
+        for name in ('cleaned_feedback', 'review_status', 'transformed', 'query_status'):
+            results[name] = feedback_watch.replace_query_rows(results[name], partial[name], affected)
+        results['stats'] = generate_aggregateScore.generate_CIScore(results['transformed'])
+
+        with output_writer.OutputStage(args.writer_workers, args.writer_pool) as outputs:
+            outputs.intermediate(feedback, args.feedback_directory, 'raw_feedback', intermediate_format)
+            outputs.intermediate(results['cleaned_feedback'], args.feedback_directory, 'cleaned_feedback',
+                                 intermediate_format)
+            outputs.intermediate(results['review_status'], args.feedback_directory, 'review_status',
+                                 intermediate_format)
+            full_feedback = generate_datafiles.get_full_feedback(results['cleaned_feedback'], publication)
+            outputs.excel_streaming(os.path.join(args.out_directory, 'All_results.xlsx'), full_feedback)
+            outputs.excel(results['transformed'], os.path.join(args.out_directory, 'transformed.xlsx'))
+            outputs.excel(results['query_status'], os.path.join(args.out_directory, 'Query_status.xlsx'))
+            outputs.excel(results['stats'], os.path.join(args.out_directory, 'stats.xlsx'))
+            # Responses do not change while watching, rewritten to keep the output set complete
+            outputs.excel_streaming(os.path.join(args.out_directory, 'latency.xlsx'), results['latency'].tables())
+            outputs.text(results['latency'].to_json(), os.path.join(args.out_directory, 'latency_sketches.json'))
+
+        for label, error in outputs.failures:
+            logging.error("Failed to write %s: %s", label, error)
+        logging.info('Re-evaluated %d queries', len(affected))
+
 if __name__ == "__main__":
     # Setup logging
     logging.basicConfig(level=logging.DEBUG)
@@ -109,6 +359,7 @@ if __name__ == "__main__":
     feedback_directory = args.feedback_directory
     input_directory = args.input_directory
     out_directory = args.out_directory
+    intermediate_format = output_writer.resolve_intermediate_format(args.intermediate_format)
     
     # Load all input data
     query_metadata, query_feedback, query_reference, publication, query_failed = load_all_inputfile(input_directory)
@@ -123,52 +374,114 @@ if __name__ == "__main__":
         exit(1)
     
     # Load all feedback data from sme_assignments folder
-    xlsm_files = feedback_data.get_feedback_files(feedback_directory)
-    feedback, reference = feedback_data.load_raw_feedback(xlsm_files)
-    
-    # Filter only publication data
-    publication_queries = list(publication['query_id'])
-    feedback = feedback[feedback['Query ID'].isin(publication_queries)]
-    feedback.to_excel(os.path.join(feedback_directory, 'raw_feedback.xlsx'))
+    store = evaluation_store.EvaluationStore(args.store) if args.store else None
+    if args.watch:
+        # Watch mode keeps the parsed workbooks to re-parse only changed ones later
+        cache = feedback_watch.WorkbookCache(store)
+        cache.update(feedback_data.scan_feedback_files(feedback_directory))
+        feedback, reference = cache.feedback()
+        sources = cache.sources()
+    else:
+        xlsm_files = feedback_data.get_feedback_files(feedback_directory)
+        sources = []
+        feedback, reference = feedback_data.load_raw_feedback(xlsm_files, store, sources)
+    if feedback is None:
+        logging.error("Failed to load feedback data")
+        exit(1)
 
-    # Extract and save unable to review queries
-    unable = feedback_data.get_unable_to_review_queries(feedback)
-    print(len(unable))
-    unable.to_excel(os.path.join(feedback_directory, 'unable.xlsx'))
+    # Stop before the heavy stages when any workbook is malformed
+    if not args.skip_validation:
+        issues = validation.validate_feedback(feedback, validation.load_sme_codes(input_directory), sources)
+        if not issues.empty:
+            validation.report_issues(issues, os.path.join(output_dir, 'validation_issues.xlsx'))
+            exit(1)
 
-    # Extract reviewed data alone
-    raw_review = feedback_data.get_reviewed_queries(feedback)
-    raw_review.to_excel(os.path.join(feedback_directory, 'review.xlsx'))
-    print(len(raw_review))
+    # Feedback may add IDs, extend the input categoricals to the shared set
+    query_metadata, query_feedback, query_reference, publication, query_failed = [
+        dtype_policy.align_categories(df)
+        for df in (query_metadata, query_feedback, query_reference, publication, query_failed)
+    ]
 
-    # Convert the raw feedback to dimension score
-    review = feedback_data.convert_to_dimensionscore(raw_review)
-    cleaned_feedback = feedback_data.convert_to_dimensionscore(feedback)
-    cleaned_feedback.to_excel(os.path.join(feedback_directory, 'cleaned_feedback.xlsx'))
-    
-    # Assign sme agreement and review status
-    review_status, data = process_query.get_review_status(review, sme_ready, cleaned_feedback)
-    review_status.to_excel(os.path.join(feedback_directory, 'review_status.xlsx'))
+    # Files are queued to the writer workers as soon as their frame is final
+    with output_writer.OutputStage(args.writer_workers, args.writer_pool) as outputs:
+        # Filter only publication data
+        publication_queries = list(publication['query_id'])
+        feedback = feedback[feedback['Query ID'].isin(publication_queries)]
 
-    # Generate data files
-    transform_df = generate_datafiles.generate_transformed_file(review, review_status)
-    transform_df.to_excel(os.path.join(out_directory, 'transformed.xlsx'), index=False)
+        # Convert once, the reviewed and unable to review subsets are masks over it
+        cleaned_feedback, review, review_mask, unable_mask = convert_feedback(feedback)
+        if cleaned_feedback is None:
+            logging.error("Failed to convert feedback to dimension scores")
+            exit(1)
+        print(int(unable_mask.sum()))
+        print(int(review_mask.sum()))
 
-    metadata = generate_datafiles.generate_publicationMetadata(publication)
-    metadata.to_excel(os.path.join(out_directory, 'Query_metadata.xlsx'), index=False)
+        outputs.intermediate(feedback, feedback_directory, 'raw_feedback', intermediate_format)
+        outputs.intermediate(cleaned_feedback, feedback_directory, 'cleaned_feedback', intermediate_format)
+        if intermediate_format != 'none':
+            outputs.intermediate(feedback[unable_mask], feedback_directory, 'unable', intermediate_format)
+            outputs.intermediate(feedback[review_mask], feedback_directory, 'review', intermediate_format)
 
-    query_feedback, query_reference = generate_datafiles.generate_queryResponse_reference(
-        query_feedback, query_reference, publication, query_failed)
-    
-    with pd.ExcelWriter(os.path.join(out_directory, 'Query_response.xlsx')) as writer:
-        query_feedback.to_excel(writer, sheet_name='Feedback', index=False)
-        query_reference.to_excel(writer, sheet_name='References', index=False)
-    
-    query_status = generate_datafiles.generate_query_status(review_status, query_feedback, publication)
-    query_status.to_excel(os.path.join(out_directory, 'Query_status.xlsx'), index=False)
+        metadata = generate_datafiles.generate_publicationMetadata(publication)
+        outputs.excel(metadata, os.path.join(out_directory, 'Query_metadata.xlsx'))
 
-    full_feedback = generate_datafiles.get_full_feedback(cleaned_feedback, publication)
-    full_feedback.to_excel(os.path.join(out_directory, 'All_results.xlsx'), index=False)
+        full_feedback = generate_datafiles.get_full_feedback(cleaned_feedback, publication)
+        outputs.excel_streaming(os.path.join(out_directory, 'All_results.xlsx'), full_feedback)
 
-    stats_df = generate_aggregateScore.generate_CIScore(transform_df)
-    stats_df.to_excel(os.path.join(out_directory, 'stats.xlsx'), index=False)
+        query_feedback, query_reference = generate_datafiles.generate_queryResponse_reference(
+            query_feedback, query_reference, publication, query_failed)
+        outputs.excel_streaming(os.path.join(out_directory, 'Query_response.xlsx'), {
+            'Feedback': query_feedback,
+            'References': query_reference
+        })
+
+        # Latency and failure rates of the model responses, with the sketches for merging runs
+        latency = latency_analytics.latency_stats(query_feedback, publication)
+        outputs.excel_streaming(os.path.join(out_directory, 'latency.xlsx'), latency.tables())
+        outputs.text(latency.to_json(), os.path.join(out_directory, 'latency_sketches.json'))
+
+        # Assign sme agreement and review status, sharded over workers unless the store answers lookups
+        if args.stage_workers > 0 and store is None:
+            review_status, data, transform_df = shared_data.sharded_review_transform(
+                review, cleaned_feedback, sme_ready, args.stage_workers)
+        else:
+            review_status, data = process_query.get_review_status(review, sme_ready, cleaned_feedback, store)
+            transform_df = None
+        outputs.intermediate(review_status, feedback_directory, 'review_status', intermediate_format)
+
+        # Generate data files
+        if transform_df is None:
+            transform_df = generate_datafiles.generate_transformed_file(data, review_status)
+        outputs.excel(transform_df, os.path.join(out_directory, 'transformed.xlsx'))
+
+        query_status = generate_datafiles.generate_query_status(review_status, query_feedback, publication)
+        outputs.excel(query_status, os.path.join(out_directory, 'Query_status.xlsx'))
+
+        stats_df = generate_aggregateScore.generate_CIScore(transform_df)
+        outputs.excel(stats_df, os.path.join(out_directory, 'stats.xlsx'))
+
+    for label, error in outputs.failures:
+        logging.error("Failed to write %s: %s", label, error)
+
+    # Watching on top of a partial output set would never reach the exit code
+    if outputs.failures:
+        if store is not None:
+            store.close()
+        exit(1)
+
+    if args.watch:
+        results = {
+            'cleaned_feedback': cleaned_feedback,
+            'review_status': review_status,
+            'transformed': transform_df,
+            'query_status': query_status,
+            'stats': stats_df,
+            'latency': latency
+        }
+        try:
+            watch_feedback(cache, results, sme_ready, publication, query_feedback, args, store)
+        except KeyboardInterrupt:
+            logging.info('Stopped watching %s', feedback_directory)
+
+    if store is not None:
+        store.close()
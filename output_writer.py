@@ -0,0 +1,291 @@
+"""
+output_writer.py
+
+This module handles persisting pipeline frames to disk.
+Intermediate frames are written in a configurable columnar format,
+Excel is reserved for the final deliverables. Large deliverables are
+streamed through openpyxl's write-only mode, and OutputStage queues
+writes to a pool of workers so they overlap computation and each other.
+
+Dependencies:
+    - pandas
+    - openpyxl
+    - pyarrow (optional, for parquet and feather)
+"""
+
+# Third-party library
+import pandas as pd
+import openpyxl as xl
+
+# Built-in library
+import os
+import warnings
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+INTERMEDIATE_FORMATS = ['parquet', 'feather', 'csv.gz', 'xlsx', 'none']
+
+WRITER_POOLS = ['process', 'thread']
+
+INTERMEDIATE_EXTENSIONS = {
+    'parquet': '.parquet',
+    'feather': '.feather',
+    'csv.gz': '.csv.gz',
+    'xlsx': '.xlsx'
+}
+
+
+def resolve_intermediate_format(fmt: str) -> str:
+    """
+    Check that an intermediate format can be written, falling back to compressed CSV.
+
+    Args:
+        fmt (str): Requested format, one of INTERMEDIATE_FORMATS
+
+    Returns:
+        str: Format that will be used
+    """
+    if fmt not in INTERMEDIATE_FORMATS:
+        raise ValueError(f"Unknown intermediate format '{fmt}', expected one of {INTERMEDIATE_FORMATS}")
+    if fmt in ('parquet', 'feather'):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            warnings.warn(f"pyarrow is not installed, writing intermediates as csv.gz instead of {fmt}")
+            return 'csv.gz'
+    return fmt
+
+
+def _arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cast object columns holding mixed value types to strings so Arrow can store them.
+
+    Args:
+        df (pd.DataFrame): Frame to write
+
+    Returns:
+        pd.DataFrame: Frame with only Arrow-compatible columns
+    """
+    mixed = [col for col in df.columns
+             if df[col].dtype == object
+             and pd.api.types.infer_dtype(df[col], skipna=True).startswith('mixed')]
+    if not mixed:
+        return df
+    df = df.copy(deep=False)
+    for col in mixed:
+        values = df[col]
+        df[col] = values.where(values.isna(), values.astype(str))
+    return df
+
+
+def write_intermediate(df: pd.DataFrame, directory: str, name: str, fmt: str = 'parquet') -> Optional[str]:
+    """
+    Write an intermediate frame in the given format.
+
+    Args:
+        df (pd.DataFrame): Frame to write
+        directory (str): Output directory
+        name (str): File name without extension
+        fmt (str): One of INTERMEDIATE_FORMATS, 'none' skips the write
+
+    Returns:
+        Optional[str]: Path of the written file, None when skipped
+    """
+    if fmt == 'none':
+        return None
+    path = os.path.join(directory, name + INTERMEDIATE_EXTENSIONS[fmt])
+    if fmt == 'parquet':
+        _arrow_safe(df).to_parquet(path)
+    elif fmt == 'feather':
+        _arrow_safe(df).rename_axis('index').reset_index().to_feather(path)
+    elif fmt == 'csv.gz':
+        df.to_csv(path, compression='gzip')
+    else:
+        df.to_excel(path)
+    return path
+
+
+def _excel_rows(df: pd.DataFrame, chunksize: int):
+    """
+    Yield the rows of a frame as lists of plain Python values, one chunk at a time.
+
+    Args:
+        df (pd.DataFrame): Frame to write
+        chunksize (int): Number of rows converted per chunk
+
+    Yields:
+        list: Cell values of one row, missing values as None
+    """
+    for start in range(0, len(df), chunksize):
+        chunk = df.iloc[start:start + chunksize].astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        yield from chunk.values.tolist()
+
+
+def write_excel_streaming(path: str,
+                          sheets: Union[pd.DataFrame, Dict[str, pd.DataFrame]],
+                          chunksize: int = 10000,
+                          index: bool = False) -> str:
+    """
+    Write one or more frames to an Excel workbook without building it in memory.
+
+    Rows are appended to openpyxl write-only worksheets in chunks, so peak memory
+    stays flat as the row count grows.
+
+    Args:
+        path (str): Output workbook path
+        sheets: A frame, or a mapping of sheet name to frame
+        chunksize (int): Number of rows converted per chunk
+        index (bool): Write the frame index as the first column
+
+    Returns:
+        str: Path of the written workbook
+    """
+    if isinstance(sheets, pd.DataFrame):
+        sheets = {'Sheet1': sheets}
+
+    book = xl.Workbook(write_only=True)
+    try:
+        for sheet_name, df in sheets.items():
+            if index:
+                df = df.reset_index()
+            sheet = book.create_sheet(sheet_name)
+            sheet.append([str(col) for col in df.columns])
+            for row in _excel_rows(df, chunksize):
+                sheet.append(row)
+        book.save(path)
+    finally:
+        book.close()
+    return path
+
+
+def write_excel(df: pd.DataFrame, path: str, index: bool = False) -> str:
+    """
+    Write a frame to an Excel workbook with the pandas writer.
+
+    Args:
+        df (pd.DataFrame): Frame to write
+        path (str): Output workbook path
+        index (bool): Write the frame index
+
+    Returns:
+        str: Path of the written workbook
+    """
+    df.to_excel(path, index=index)
+    return path
+
+
+def write_text(text: str, path: str) -> str:
+    """
+    Write a text deliverable, e.g. JSON.
+
+    Args:
+        text (str): File content
+        path (str): Output file path
+
+    Returns:
+        str: Path of the written file
+    """
+    with open(path, 'w') as handle:
+        handle.write(text)
+    return path
+
+
+class OutputStage:
+    """
+    Queue of finished frames written by a pool of writer workers.
+
+    Frames handed to the stage must not be modified afterwards. Failures are
+    collected instead of raised, so every other write still completes; check
+    them with wait() or the failures attribute after leaving the context.
+    """
+
+    def __init__(self, workers: int = 4, pool: str = 'process'):
+        """
+        Args:
+            workers (int): Number of writer workers, 0 writes synchronously
+            pool (str): 'process' or 'thread' workers
+        """
+        if pool not in WRITER_POOLS:
+            raise ValueError(f"Unknown writer pool '{pool}', expected one of {WRITER_POOLS}")
+        self._executor: Optional[Executor] = None
+        if workers > 0:
+            executor_cls = ProcessPoolExecutor if pool == 'process' else ThreadPoolExecutor
+            self._executor = executor_cls(max_workers=workers)
+        self._pending: List[Tuple[str, Future]] = []
+        self.failures: List[Tuple[str, BaseException]] = []
+
+    def submit(self, label: str, func: Callable, *args, **kwargs):
+        """
+        Queue a write.
+
+        Args:
+            label (str): Name reported if the write fails
+            func (Callable): Module-level writer function
+            *args, **kwargs: Arguments of the writer function
+        """
+        if self._executor is None:
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                self.failures.append((label, e))
+            return
+        self._pending.append((label, self._executor.submit(func, *args, **kwargs)))
+
+    def excel(self, df: pd.DataFrame, path: str, index: bool = False):
+        """
+        Queue an Excel deliverable written with the pandas writer.
+        """
+        self.submit(os.path.basename(path), write_excel, df, path, index)
+
+    def excel_streaming(self, path: str, sheets: Union[pd.DataFrame, Dict[str, pd.DataFrame]], **kwargs):
+        """
+        Queue an Excel deliverable written with write_excel_streaming.
+        """
+        self.submit(os.path.basename(path), write_excel_streaming, path, sheets, **kwargs)
+
+    def text(self, text: str, path: str):
+        """
+        Queue a text deliverable written with write_text.
+        """
+        self.submit(os.path.basename(path), write_text, text, path)
+
+    def intermediate(self, df: pd.DataFrame, directory: str, name: str, fmt: str):
+        """
+        Queue an intermediate frame, nothing is queued when fmt is 'none'.
+        """
+        if fmt != 'none':
+            self.submit(name, write_intermediate, df, directory, name, fmt)
+
+    def wait(self) -> List[Tuple[str, BaseException]]:
+        """
+        Wait for every queued write.
+
+        Returns:
+            List[Tuple[str, BaseException]]: Label and error of each failed write
+        """
+        for label, future in self._pending:
+            try:
+                future.result()
+            except Exception as e:
+                self.failures.append((label, e))
+        self._pending = []
+        return self.failures
+
+    def close(self):
+        """
+        Wait for every queued write and stop the workers.
+        """
+        try:
+            self.wait()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def __enter__(self) -> 'OutputStage':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -98,9 +98,11 @@ def collapsed_score(data: pd.DataFrame) -> pd.DataFrame:
         data: DataFrame containing review scores
 
     Returns:
-        DataFrame with additional grouped score columns
+        DataFrame with additional grouped score columns, the input is not modified
     """
     try:
+        # Shallow copy, columns are replaced or added without touching the caller's frame
+        data = data.copy(deep=False)
         columns = [
             'Overall Answer Helpfulness',
             'Comprehension',
@@ -189,7 +191,27 @@ def add_not_reviwed_smes(assigned_smes: list, reviewed_smes: list, unable_to_rev
         traceback.print_exc()
         return None   
 
-def get_review_status(feedback: pd.DataFrame, sme_data: pd.DataFrame, master_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+def query_assignments(master_df: pd.DataFrame, query: str, store=None) -> Tuple[list, list]:
+    """
+    Get the SMEs assigned to a query and the ones unable to review it.
+
+    Args:
+        master_df: DataFrame containing master data
+        query: Query ID
+        store: Optional EvaluationStore answering the lookup from its index
+
+    Returns:
+        Tuple of (assigned SMEs, SMEs unable to review)
+    """
+    if store is not None:
+        return store.query_smes(query)
+    query_rows = master_df['Query ID'] == query
+    assigned_smes = list(master_df.loc[query_rows, 'SME'])
+    unable_smes = list(master_df.loc[query_rows & (master_df['Unable to Review'] == 'X'), 'SME'])
+    return assigned_smes, unable_smes
+
+def get_review_status(feedback: pd.DataFrame, sme_data: pd.DataFrame, master_df: pd.DataFrame,
+                      store=None) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
     Generate review status for all queries.
 
@@ -197,6 +219,8 @@ def get_review_status(feedback: pd.DataFrame, sme_data: pd.DataFrame, master_df:
         feedback: DataFrame containing review feedback
         sme_data: DataFrame containing SME information
         master_df: DataFrame containing master data
+        store: Optional EvaluationStore, assigned and unable to review SMEs of a
+            query are then indexed reads instead of scans of master_df
 
     Returns:
         Tuple containing review status DataFrame and processed data DataFrame
@@ -210,11 +234,8 @@ def get_review_status(feedback: pd.DataFrame, sme_data: pd.DataFrame, master_df:
         imcomplete = [s for s in full_queries if not any(sub in s for sub in query_list)]
         
         for query in query_list:
-            # Get all SMEs assigned to the query
-            assigned_smes = list(master_df[master_df['Query ID'] == query]['SME'])
-            # Unable to review SMEs
-            unable_to_review_smes = list(master_df[(master_df['Query ID'] == query) & 
-                                                 (master_df['Unable to Review'] == 'X')]['SME'])
+            # Get all SMEs assigned to the query and the ones unable to review it
+            assigned_smes, unable_to_review_smes = query_assignments(master_df, query, store)
             df_query = data[data['Query ID'] == query]
             # Get all SMEs who reviewed the query completely
             reviewed_smes = list(df_query['SME'])
@@ -274,9 +295,7 @@ def get_review_status(feedback: pd.DataFrame, sme_data: pd.DataFrame, master_df:
         # Add non reviewed data
         data_incompleted = []
         for q in imcomplete:
-            assign_smes = list(master_df[master_df['Query ID'] == q]['SME'])
-            unable_smes = list(master_df[(master_df['Query ID'] == q) & 
-                                       (master_df['Unable to Review'] == 'X')]['SME'])
+            assign_smes, unable_smes = query_assignments(master_df, q, store)
             review_smes = []
             not_reviewed = add_not_reviwed_smes(assign_smes, review_smes, unable_smes)
             data_incompleted.append({
@@ -0,0 +1,333 @@
+"""
+reference_index.py
+
+This module indexes the References sheets of the model query output and of
+the SME feedback workbooks. References are interned to integer IDs keyed on
+their normalized URL (the title when there is no URL), query IDs are interned
+the same way, and the distinct (query, reference) pairs are kept as compact
+integer arrays with a flag per pair telling whether the model output, the
+SMEs, or both cited it.
+
+Both directions are stored as CSR adjacency (an offsets array plus the
+sorted neighbor IDs), so "which queries cite X", the references of a query
+and per-query counts are array slices or reductions instead of scans of the
+reference frames.
+
+The References sheets only have a fixed Query ID column, so the URL and title
+columns are detected from REFERENCE_URL_COLUMNS and REFERENCE_TITLE_COLUMNS
+unless they are given.
+
+Dependencies:
+    - pandas
+    - numpy
+"""
+
+# Third-party library
+import pandas as pd
+import numpy as np
+
+# Built-in library
+import os
+import re
+import logging
+import argparse
+from typing import List, Optional, Tuple
+
+# Custom/User-defined module
+import main
+import feedback_data
+
+# Origin flags of a (query, reference) pair
+MODEL_ORIGIN = 1
+SME_ORIGIN = 2
+
+# Candidate References sheet columns, first match wins, compared case-insensitively
+REFERENCE_URL_COLUMNS = ['Reference URL', 'URL', 'Reference Link', 'Link', 'Source URL']
+REFERENCE_TITLE_COLUMNS = ['Reference Title', 'Title', 'Reference', 'Source Title', 'Source']
+
+
+def setup_args() -> argparse.ArgumentParser:
+    """
+    Setup command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Index the references of the model output and SME workbooks.')
+    parser.add_argument('feedback_directory', type=str, help='Directory with the SME feedback workbooks.')
+    parser.add_argument('input_directory', type=str, help='Directory with the query output and Publication.xlsx.')
+    parser.add_argument('out_file', type=str, help='Excel file to write the reuse and coverage tables to.')
+    parser.add_argument('--run', type=str, default='initial', help='Run of the query_output-<run>.xlsx file.')
+    parser.add_argument('--url-column', type=str, default=None,
+                        help='References sheet column with the reference URL, detected by default.')
+    parser.add_argument('--title-column', type=str, default=None,
+                        help='References sheet column with the reference title, detected by default.')
+    return parser
+
+
+def find_column(columns: pd.Index, column: Optional[str], candidates: List[str], source: str) -> Optional[str]:
+    """
+    Resolve a References sheet column, given or detected.
+
+    Args:
+        columns (pd.Index): Columns of the References sheet
+        column (Optional[str]): Column given by the caller, must exist
+        candidates (List[str]): Names tried in order when no column is given
+        source (str): File or directory of the sheet, named in errors
+
+    Returns:
+        Optional[str]: Column name, None when no candidate is present
+    """
+    if column is not None:
+        if column not in columns:
+            raise ValueError(f"{source}: References sheet has no '{column}' column (columns: {list(columns)})")
+        return column
+    names = {str(name).strip().lower(): name for name in columns}
+    return next((names[candidate.lower()] for candidate in candidates if candidate.lower() in names), None)
+
+
+def reference_columns(references: pd.DataFrame, source: str, url_column: Optional[str] = None,
+                      title_column: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Resolve the URL and title columns of a References sheet.
+
+    Args:
+        references (pd.DataFrame): Reference rows
+        source (str): File or directory of the sheet, named in errors
+        url_column (Optional[str]): URL column, detected from REFERENCE_URL_COLUMNS by default
+        title_column (Optional[str]): Title column, detected from REFERENCE_TITLE_COLUMNS by default
+
+    Returns:
+        Tuple[Optional[str], Optional[str]]: (URL column, title column), at least one of them set
+    """
+    if 'Query ID' not in references:
+        raise ValueError(f"{source}: References sheet has no 'Query ID' column (columns: {list(references.columns)})")
+    url_column = find_column(references.columns, url_column, REFERENCE_URL_COLUMNS, source)
+    title_column = find_column(references.columns, title_column, REFERENCE_TITLE_COLUMNS, source)
+    if url_column is None and title_column is None:
+        raise ValueError(
+            f"{source}: References sheet has no URL column ({', '.join(REFERENCE_URL_COLUMNS)}) and no title "
+            f"column ({', '.join(REFERENCE_TITLE_COLUMNS)}), pass url_column or title_column "
+            f"(columns: {list(references.columns)})")
+    return url_column, title_column
+
+
+def reference_keys(references: pd.DataFrame, url_column: Optional[str], title_column: Optional[str]) -> pd.Series:
+    """
+    Normalized key of each reference row: its URL without fragment and trailing slash, or its title.
+
+    Args:
+        references (pd.DataFrame): Reference rows
+        url_column (Optional[str]): URL column, None when the sheet has none
+        title_column (Optional[str]): Title column, None when the sheet has none
+
+    Returns:
+        pd.Series: Key per row, missing when the row has neither
+    """
+    missing = pd.Series(pd.NA, index=references.index, dtype='string')
+    urls = references[url_column].astype('string').str.strip() if url_column is not None else missing
+    urls = urls.str.replace(r'#.*$', '', regex=True).str.rstrip('/')
+    titles = references[title_column].astype('string').str.strip().str.lower() if title_column is not None else missing
+    keys = urls.where(urls.str.len() > 0, titles)
+    return keys.where(keys.str.len() > 0)
+
+
+def csr(rows: np.ndarray, columns: np.ndarray, n_rows: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Build CSR adjacency from (row, column) pairs.
+
+    Args:
+        rows (np.ndarray): Row ID of each pair
+        columns (np.ndarray): Column ID of each pair
+        n_rows (int): Number of rows
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: (offsets of length n_rows + 1, column IDs sorted
+            within each row, order of the pairs in the adjacency)
+    """
+    order = np.lexsort((columns, rows))
+    offsets = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=offsets[1:])
+    return offsets, columns[order].astype(np.int32), order
+
+
+class ReferenceIndex:
+    """
+    Interned references and queries with CSR adjacency in both directions.
+    """
+
+    def __init__(self, queries: pd.Index, references: pd.Index, titles: np.ndarray,
+                 pair_queries: np.ndarray, pair_references: np.ndarray, pair_origins: np.ndarray):
+        self.queries = queries
+        self.references = references
+        self.titles = titles
+        self.query_ids = {query: i for i, query in enumerate(queries)}
+        self.reference_ids = {reference: i for i, reference in enumerate(references)}
+
+        self.query_offsets, self.query_references, order = csr(pair_queries, pair_references, len(queries))
+        self.query_origins = pair_origins[order]
+        self.reference_offsets, self.reference_queries, _ = csr(pair_references, pair_queries, len(references))
+
+    @classmethod
+    def build(cls, model_references: Optional[pd.DataFrame] = None,
+              sme_references: Optional[pd.DataFrame] = None, url_column: Optional[str] = None,
+              title_column: Optional[str] = None, model_source: str = 'query output',
+              sme_source: str = 'SME workbooks') -> 'ReferenceIndex':
+        """
+        Intern the references and queries of the reference frames.
+
+        Args:
+            model_references (Optional[pd.DataFrame]): References sheet of the query output
+            sme_references (Optional[pd.DataFrame]): References sheets of the SME workbooks,
+                as returned by load_raw_feedback
+            url_column (Optional[str]): URL column of both sheets, detected per sheet by default
+            title_column (Optional[str]): Title column of both sheets, detected per sheet by default
+            model_source (str): File of the query output, named in errors
+            sme_source (str): Directory of the SME workbooks, named in errors
+
+        Returns:
+            ReferenceIndex: Index over the distinct (query, reference) pairs
+        """
+        frames = []
+        for frame, origin, source in ((model_references, MODEL_ORIGIN, model_source),
+                                      (sme_references, SME_ORIGIN, sme_source)):
+            if frame is not None and not frame.empty:
+                urls, titles = reference_columns(frame, source, url_column, title_column)
+                frames.append(pd.DataFrame({
+                    'query': frame['Query ID'].astype('string').to_numpy(),
+                    'key': reference_keys(frame, urls, titles).to_numpy(),
+                    'title': frame[titles].astype(object).to_numpy() if titles is not None else None,
+                    'origin': origin
+                }))
+        rows = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+            {'query': pd.Series(dtype='string'), 'key': pd.Series(dtype='string'),
+             'title': pd.Series(dtype=object), 'origin': pd.Series(dtype=np.int64)})
+        rows = rows[rows['query'].notna() & rows['key'].notna()]
+
+        # Hash table interning of queries and references
+        query_codes, queries = pd.factorize(rows['query'], sort=True)
+        reference_codes, references = pd.factorize(rows['key'], sort=True)
+        _, first_rows = np.unique(reference_codes, return_index=True)
+        titles = rows['title'].to_numpy()[first_rows]
+
+        # Distinct pairs with the origins that cite them
+        pair_codes = query_codes.astype(np.int64) * max(len(references), 1) + reference_codes
+        pairs, inverse = np.unique(pair_codes, return_inverse=True)
+        origins = np.zeros(len(pairs), dtype=np.int8)
+        np.bitwise_or.at(origins, inverse, rows['origin'].to_numpy().astype(np.int8))
+        pair_queries, pair_references = np.divmod(pairs, max(len(references), 1))
+        return cls(pd.Index(queries), pd.Index(references), titles,
+                   pair_queries.astype(np.int64), pair_references.astype(np.int64), origins)
+
+    def reference_id(self, reference: str) -> Optional[int]:
+        """
+        Interned ID of a reference URL or title, None when it is not cited.
+        """
+        reference = str(reference).strip()
+        url = re.sub(r'#.*$', '', reference).rstrip('/')
+        reference_id = self.reference_ids.get(url)
+        return reference_id if reference_id is not None else self.reference_ids.get(reference.lower())
+
+    def queries_citing(self, reference: str) -> List[str]:
+        """
+        Queries citing a reference.
+
+        Args:
+            reference (str): Reference URL or title
+
+        Returns:
+            List[str]: Sorted query IDs, empty when the reference is not cited
+        """
+        reference_id = self.reference_id(reference)
+        if reference_id is None:
+            return []
+        start, end = self.reference_offsets[reference_id], self.reference_offsets[reference_id + 1]
+        return list(self.queries[self.reference_queries[start:end]])
+
+    def references_of(self, query: str) -> List[str]:
+        """
+        Distinct references cited for a query, by their keys.
+        """
+        query_id = self.query_ids.get(query)
+        if query_id is None:
+            return []
+        start, end = self.query_offsets[query_id], self.query_offsets[query_id + 1]
+        return list(self.references[self.query_references[start:end]])
+
+    def coverage(self) -> pd.DataFrame:
+        """
+        Distinct sources per query and how many the model output and the SMEs share.
+
+        Returns:
+            pd.DataFrame: Query ID, references, model_references, sme_references and shared_references
+        """
+        n_queries = len(self.queries)
+        owners = np.repeat(np.arange(n_queries), np.diff(self.query_offsets))
+        model = (self.query_origins & MODEL_ORIGIN) > 0
+        sme = (self.query_origins & SME_ORIGIN) > 0
+        return pd.DataFrame({
+            'Query ID': self.queries,
+            'references': np.diff(self.query_offsets),
+            'model_references': np.bincount(owners[model], minlength=n_queries),
+            'sme_references': np.bincount(owners[sme], minlength=n_queries),
+            'shared_references': np.bincount(owners[model & sme], minlength=n_queries)
+        })
+
+    def reuse(self) -> pd.DataFrame:
+        """
+        Number of queries citing each reference, most cited first.
+
+        Returns:
+            pd.DataFrame: Reference, Reference Title and queries
+        """
+        reuse = pd.DataFrame({
+            'Reference': self.references,
+            'Reference Title': self.titles,
+            'queries': np.diff(self.reference_offsets)
+        })
+        return reuse.sort_values(['queries', 'Reference'], ascending=[False, True], ignore_index=True)
+
+
+def load_reference_index(feedback_directory: str, input_directory: str, run: str = 'initial',
+                         url_column: Optional[str] = None, title_column: Optional[str] = None) -> ReferenceIndex:
+    """
+    Index the references of the publication queries.
+
+    Args:
+        feedback_directory (str): Directory with the SME feedback workbooks
+        input_directory (str): Directory containing the query output and Publication.xlsx
+        run (str): Run of the query output file
+        url_column (Optional[str]): URL column of the References sheets, detected by default
+        title_column (Optional[str]): Title column of the References sheets, detected by default
+
+    Returns:
+        ReferenceIndex: Index of the model output and SME references
+    """
+    publication = pd.read_excel(os.path.join(input_directory, 'Publication.xlsx'), sheet_name='Publication query list')
+    publication_queries = set(publication['query_id'].astype(str))
+    _, model_references, _ = main.load_query_output(input_directory, run)
+    _, sme_references = feedback_data.load_raw_feedback(feedback_data.get_feedback_files(feedback_directory))
+    if sme_references is None:
+        raise RuntimeError(f"Failed to load feedback from {feedback_directory}")
+
+    model_source = os.path.join(input_directory, f'query_output-{run}.xlsx')
+    frames = []
+    for frame, source in ((model_references, model_source), (sme_references, feedback_directory)):
+        if frame.empty:
+            frames.append(None)
+            continue
+        if 'Query ID' not in frame:
+            raise ValueError(f"{source}: References sheet has no 'Query ID' column (columns: {list(frame.columns)})")
+        frames.append(frame[frame['Query ID'].astype(str).isin(publication_queries)])
+    return ReferenceIndex.build(*frames, url_column=url_column, title_column=title_column,
+                                model_source=model_source, sme_source=feedback_directory)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = setup_args()
+    args = parser.parse_args()
+
+    index = load_reference_index(args.feedback_directory, args.input_directory, args.run,
+                                 args.url_column, args.title_column)
+    with pd.ExcelWriter(args.out_file) as writer:
+        index.reuse().to_excel(writer, sheet_name='Reuse', index=False)
+        index.coverage().to_excel(writer, sheet_name='Coverage', index=False)
+    logging.info('Indexed %d references over %d queries', len(index.references), len(index.queries))
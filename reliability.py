@@ -0,0 +1,343 @@
+"""
+reliability.py
+
+This module computes inter-rater reliability of the reviewed feedback:
+Cohen's kappa between the first two raters of each query, Fleiss' kappa and
+Krippendorff's alpha (nominal) over all raters, for each of the six
+dimensions, overall and per publication metadata stratum, with percentile
+bootstrap intervals over queries.
+
+Ratings are integer coded once into rater-by-query matrices. Every
+coefficient is a function of per-query sums (category counts from bincount,
+coincidence terms, rater 1/2 agreement), so a stratum or a bootstrap
+replicate is just a weight vector over queries and a chunk of replicates is
+evaluated for all dimensions with one matrix product per stratum.
+
+Dependencies:
+    - pandas
+    - numpy
+"""
+
+# Third-party library
+import pandas as pd
+import numpy as np
+
+# Built-in library
+import os
+import logging
+import warnings
+import argparse
+from typing import List, Optional, Tuple
+
+# Custom/User-defined module
+import main
+import feedback_data
+import process_query
+import dtype_policy
+import validation
+
+DIMENSIONS = feedback_data.DIMENSION_COLUMNS
+
+STRATUM_COLUMNS = [
+    'source',
+    'specialties',
+    'speciality_routing',
+    'sex_at_birth',
+    'age_categories',
+    'special_populations',
+    'sensitive_topics',
+    'query_type'
+]
+
+COEFFICIENTS = ['cohen_kappa', 'fleiss_kappa', 'krippendorff_alpha']
+
+# Cell values that mean no rating; 'na' is the Not Applicable category and is kept
+MISSING_VALUES = ['nan', 'None', '']
+
+CONSENSUS_SME = 'EVAL-consensus'
+
+# Upper bound of bootstrap weight cells generated at once
+BOOTSTRAP_CHUNK_CELLS = 5_000_000
+
+RESULT_COLUMNS = ['stratum', 'stratum_value', 'dimension', 'coefficient', 'estimate',
+                  'ci_lower', 'ci_upper', 'n_queries', 'n_ratings']
+
+
+def setup_args() -> argparse.ArgumentParser:
+    """
+    Setup command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Inter-rater reliability of the reviewed feedback.')
+    parser.add_argument('feedback_directory', type=str, help='Directory with feedback and disagreement data.')
+    parser.add_argument('input_directory', type=str, help='Directory with the Publication.xlsx and SME master files.')
+    parser.add_argument('out_file', type=str, help='Excel file to write the coefficients to.')
+    parser.add_argument('--bootstrap', type=int, default=1000, help='Bootstrap replicates, 0 to skip intervals.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the bootstrap resampling.')
+    parser.add_argument('--strata', type=str, nargs='*', default=STRATUM_COLUMNS,
+                        help='Publication metadata columns to stratify by.')
+    parser.add_argument('--skip-validation', action='store_true',
+                        help='Compute on feedback with validation issues (missing columns, unknown scores or SMEs, duplicates).')
+    return parser
+
+
+def load_reviewed_ratings(feedback_directory: str, input_directory: str,
+                          validate: bool = True) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Load the reviewed ratings of the publication queries, as passed to get_review_status.
+
+    Args:
+        feedback_directory (str): Directory with the SME feedback workbooks
+        input_directory (str): Directory containing Publication.xlsx and the SME master
+        validate (bool): Refuse feedback that fails validation, as main.py does
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: (reviewed ratings as collapsed score strings, publication)
+    """
+    publication = pd.read_excel(os.path.join(input_directory, 'Publication.xlsx'),
+                                sheet_name='Publication query list')
+    publication = dtype_policy.apply_dtype_policy(publication)
+    sources = []
+    feedback, _ = feedback_data.load_raw_feedback(feedback_data.get_feedback_files(feedback_directory), None, sources)
+    if feedback is None:
+        raise RuntimeError(f"Failed to load feedback from {feedback_directory}")
+    if validate:
+        issues = validation.validate_feedback(feedback, validation.load_sme_codes(input_directory), sources)
+        if not issues.empty:
+            validation.report_issues(issues)
+            raise RuntimeError(f"Feedback in {feedback_directory} failed validation with {len(issues)} issues")
+    feedback = feedback[feedback['Query ID'].isin(list(publication['query_id']))]
+    _, review, _, _ = main.convert_feedback(feedback)
+    return process_query.collapsed_score(review), publication
+
+
+def rating_matrix(ratings: pd.DataFrame, dimension: str, query_codes: np.ndarray,
+                  rater_slots: np.ndarray, n_queries: int) -> Tuple[np.ndarray, int]:
+    """
+    Integer code one dimension into a query by rater matrix.
+
+    Args:
+        ratings (pd.DataFrame): Reviewed ratings, one row per query and SME
+        dimension (str): Dimension column
+        query_codes (np.ndarray): Query index of each row
+        rater_slots (np.ndarray): Position of each row among the raters of its query
+        n_queries (int): Number of queries
+
+    Returns:
+        Tuple[np.ndarray, int]: (query by rater category codes, -1 where not rated; number of categories)
+    """
+    values = ratings[dimension].astype(str)
+    values = values.where(~values.isin(MISSING_VALUES))
+    codes, categories = pd.factorize(values, sort=True, use_na_sentinel=True)
+    matrix = np.full((n_queries, int(rater_slots.max()) + 1 if len(rater_slots) else 2), -1, dtype=np.int64)
+    matrix[query_codes, rater_slots] = codes
+    if matrix.shape[1] < 2:
+        matrix = np.hstack([matrix, np.full((n_queries, 1), -1, dtype=np.int64)])
+    return matrix, len(categories)
+
+
+def query_terms(matrix: np.ndarray, n_categories: int) -> np.ndarray:
+    """
+    Per-query terms whose weighted sums give every coefficient.
+
+    Columns: rated (m), pairable (m >= 2), m of pairable queries, Fleiss agreement
+    P_q, coincidence diagonal sum (sum n_qk (n_qk - 1) / (m - 1)), rater 1/2 pair
+    and agreement indicators, then n_qk of pairable queries, rater 1 and rater 2
+    one-hot categories, K columns each.
+
+    Args:
+        matrix (np.ndarray): Query by rater category codes from rating_matrix
+        n_categories (int): Number of categories
+
+    Returns:
+        np.ndarray: Query by (7 + 3K) term matrix
+    """
+    n_queries = matrix.shape[0]
+    k = max(n_categories, 1)
+    rows, _ = np.nonzero(matrix >= 0)
+    counts = np.bincount(rows * k + matrix[matrix >= 0], minlength=n_queries * k).reshape(n_queries, k)
+
+    m = counts.sum(axis=1).astype(float)
+    pairable = (m >= 2).astype(float)
+    sum_squares = (counts.astype(float) ** 2).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fleiss_agreement = np.where(m >= 2, (sum_squares - m) / (m * (m - 1)), 0.0)
+        coincidence = np.where(m >= 2, (sum_squares - m) / (m - 1), 0.0)
+
+    first, second = matrix[:, 0], matrix[:, 1]
+    pair = (first >= 0) & (second >= 0)
+    agree = pair & (first == second)
+    eye = np.eye(k)
+    first_onehot = np.where(pair[:, None], eye[np.clip(first, 0, None)], 0.0)
+    second_onehot = np.where(pair[:, None], eye[np.clip(second, 0, None)], 0.0)
+
+    return np.column_stack([
+        m, pairable, m * pairable, fleiss_agreement, coincidence, pair, agree,
+        counts * pairable[:, None], first_onehot, second_onehot
+    ]).astype(float)
+
+
+def coefficients_from_sums(sums: np.ndarray, n_categories: int) -> np.ndarray:
+    """
+    Compute the coefficients from weighted sums of query_terms.
+
+    Args:
+        sums (np.ndarray): Replicates by term weighted sums
+        n_categories (int): Number of categories
+
+    Returns:
+        np.ndarray: Replicates by COEFFICIENTS values, NaN where undefined
+    """
+    k = max(n_categories, 1)
+    n_pairable, n_values, fleiss_sum, coincidence_sum = sums[:, 1], sums[:, 2], sums[:, 3], sums[:, 4]
+    pairs, agreements = sums[:, 5], sums[:, 6]
+    category_totals = sums[:, 7:7 + k]
+    first_totals = sums[:, 7 + k:7 + 2 * k]
+    second_totals = sums[:, 7 + 2 * k:7 + 3 * k]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        observed = agreements / pairs
+        expected = (first_totals * second_totals).sum(axis=1) / pairs ** 2
+        cohen = (observed - expected) / (1 - expected)
+
+        mean_agreement = fleiss_sum / n_pairable
+        chance = ((category_totals / n_values[:, None]) ** 2).sum(axis=1)
+        fleiss = (mean_agreement - chance) / (1 - chance)
+
+        disagreement = n_values - coincidence_sum
+        expected_disagreement = n_values ** 2 - (category_totals ** 2).sum(axis=1)
+        alpha = 1 - (n_values - 1) * disagreement / expected_disagreement
+
+    return np.column_stack([cohen, fleiss, alpha])
+
+
+def bootstrap_counts(n_queries: int, replicates: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Draw bootstrap resampling counts, how often each query is drawn in each replicate.
+
+    Args:
+        n_queries (int): Number of queries
+        replicates (int): Number of replicates
+        rng (np.random.Generator): Random generator
+
+    Returns:
+        np.ndarray: Replicates by queries counts as uint8
+    """
+    counts = np.empty((replicates, n_queries), dtype=np.uint8)
+    chunk = max(1, BOOTSTRAP_CHUNK_CELLS // max(n_queries, 1))
+    for start in range(0, replicates, chunk):
+        size = min(chunk, replicates - start)
+        draws = rng.integers(0, n_queries, size=(size, n_queries), dtype=np.int32).astype(np.int64)
+        draws += (np.arange(size) * n_queries)[:, None]
+        drawn = np.bincount(draws.ravel(), minlength=size * n_queries).reshape(size, n_queries)
+        counts[start:start + size] = np.minimum(drawn, 255)
+    return counts
+
+
+def compute_reliability(ratings: pd.DataFrame, publication: Optional[pd.DataFrame] = None,
+                        strata: Optional[List[str]] = None, bootstrap: int = 1000,
+                        seed: int = 0, confidence: float = 0.95) -> pd.DataFrame:
+    """
+    Compute the reliability coefficients of every dimension, overall and per stratum.
+
+    Args:
+        ratings (pd.DataFrame): Reviewed ratings with Query ID, SME and dimension columns
+        publication (Optional[pd.DataFrame]): Publication query list with the stratum columns
+        strata (Optional[List[str]]): Stratum columns, STRATUM_COLUMNS by default
+        bootstrap (int): Bootstrap replicates, 0 to skip the intervals
+        seed (int): Seed of the bootstrap resampling
+        confidence (float): Coverage of the percentile intervals
+
+    Returns:
+        pd.DataFrame: One row per stratum, dimension and coefficient, see RESULT_COLUMNS
+    """
+    ratings = ratings[ratings['SME'].astype(str) != CONSENSUS_SME]
+    query_codes, queries = pd.factorize(ratings['Query ID'].astype(str))
+    rater_slots = ratings.groupby(query_codes, sort=False).cumcount().to_numpy()
+    n_queries = len(queries)
+
+    # Terms of all dimensions side by side, a weight matrix is applied to all at once
+    layouts = {}
+    blocks = []
+    offset = 0
+    for dimension in DIMENSIONS:
+        matrix, n_categories = rating_matrix(ratings, dimension, query_codes, rater_slots, n_queries)
+        terms = query_terms(matrix, n_categories)
+        layouts[dimension] = (offset, offset + terms.shape[1], n_categories)
+        blocks.append(terms)
+        offset += terms.shape[1]
+    terms = np.hstack(blocks) if blocks else np.empty((n_queries, 0))
+
+    # Each stratum column orders the queries by level, so a level is a contiguous slice
+    columns = [('All', np.arange(n_queries), np.array([0, n_queries]), ['All'])]
+    if publication is not None:
+        metadata = publication.assign(query_id=publication['query_id'].astype(str)).drop_duplicates('query_id')
+        metadata = metadata.set_index('query_id').reindex(queries)
+        for column in (strata if strata is not None else STRATUM_COLUMNS):
+            if column not in metadata:
+                continue
+            codes, labels = pd.factorize(metadata[column].astype(object))
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+            # Queries without a value (code -1) come first and are left out
+            columns.append((column, order[bounds[0]:], bounds - bounds[0], list(labels)))
+
+    groups = []
+    for column, order, bounds, labels in columns:
+        for level, label in enumerate(labels):
+            groups.append((column, label, order[bounds[level]:bounds[level + 1]]))
+
+    # Resampling counts are exchangeable across queries, so each stratum column
+    # pairs the same count matrix with its own query order instead of gathering it
+    rng = np.random.default_rng(seed)
+    counts = bootstrap_counts(n_queries, bootstrap, rng) if bootstrap > 0 and n_queries else None
+    replicate_sums = [[] for _ in groups]
+    chunk = max(1, BOOTSTRAP_CHUNK_CELLS // max(n_queries, 1))
+    position = 0
+    for column, order, bounds, labels in columns:
+        ordered_terms = terms[order].astype(np.float32)
+        for start in range(0, bootstrap if counts is not None else 0, chunk):
+            weights = counts[start:start + chunk, :len(order)].astype(np.float32)
+            for level in range(len(labels)):
+                low, high = bounds[level], bounds[level + 1]
+                replicate_sums[position + level].append(
+                    (weights[:, low:high] @ ordered_terms[low:high]).astype(float))
+        position += len(labels)
+
+    tail = (1 - confidence) / 2 * 100
+    results = []
+    for (stratum, value, index), sums in zip(groups, replicate_sums):
+        estimates = terms[index].sum(axis=0, keepdims=True)
+        sums = np.vstack(sums) if sums else np.empty((0, terms.shape[1]))
+        for dimension, (start, end, n_categories) in layouts.items():
+            estimate = coefficients_from_sums(estimates[:, start:end], n_categories)[0]
+            lower = upper = np.full(len(COEFFICIENTS), np.nan)
+            if len(sums):
+                replicates = coefficients_from_sums(sums[:, start:end], n_categories)
+                with warnings.catch_warnings():
+                    # Coefficients undefined in every replicate stay NaN
+                    warnings.simplefilter('ignore', RuntimeWarning)
+                    lower = np.nanpercentile(replicates, tail, axis=0)
+                    upper = np.nanpercentile(replicates, 100 - tail, axis=0)
+            n_pairable = int(estimates[0, start + 1])
+            n_ratings = int(estimates[0, start])
+            for position, coefficient in enumerate(COEFFICIENTS):
+                results.append([stratum, value, dimension, coefficient, estimate[position],
+                                lower[position], upper[position], n_pairable, n_ratings])
+
+    return pd.DataFrame(results, columns=RESULT_COLUMNS).round(4)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = setup_args()
+    args = parser.parse_args()
+
+    try:
+        ratings, publication = load_reviewed_ratings(args.feedback_directory, args.input_directory,
+                                                     not args.skip_validation)
+    except RuntimeError as e:
+        logging.error(e)
+        exit(1)
+    reliability = compute_reliability(ratings, publication, args.strata, args.bootstrap, args.seed)
+    reliability.to_excel(args.out_file, index=False)
+    logging.info('Wrote %d reliability coefficients to %s', len(reliability), args.out_file)
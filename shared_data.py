@@ -0,0 +1,330 @@
+"""
+shared_data.py
+
+This module is a shared memory data plane for process-pool stages. A frame is
+published once: categorical and text columns are stored as integer codes and
+numeric columns as their values, all in one multiprocessing.shared_memory
+block. Workers receive a small picklable FrameHandle (block name, column
+layout and categories) and attach to the block by name, so the arrays are
+never pickled or copied per task.
+
+The review status and transform stages are sharded on top of it: every
+worker attaches to the published review and assignment frames, selects the
+queries of its shard through the Query ID codes and runs the existing stage
+functions on that slice. Shards split queries by a stable hash of the ID, so
+the same query lands in the same shard in every frame. Merged rows are
+ordered by where each query first appears in the published frames.
+
+Dependencies:
+    - pandas
+    - numpy
+"""
+
+# Third-party library
+import pandas as pd
+import numpy as np
+
+# Built-in library
+import zlib
+import logging
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Custom/User-defined module
+import process_query
+import generate_datafiles
+import feedback_data
+
+# Columns of cleaned_feedback the review status stage reads
+ASSIGNMENT_COLUMNS = ['Query ID', 'SME', 'Unable to Review']
+
+INDEX_COLUMN = '__index__'
+
+# Sort key of the sharded rows, dropped once the shards are merged
+POSITION_COLUMN = '__position__'
+
+# Blocks attached by this worker process, kept open for later tasks
+_ATTACHED: Dict[str, 'SharedFrame'] = {}
+
+
+class ColumnLayout(NamedTuple):
+    """
+    Position of one column in a shared memory block.
+    """
+    name: str
+    dtype: str
+    offset: int
+    categories: Optional[pd.Index]
+
+
+class FrameHandle(NamedTuple):
+    """
+    Picklable reference to a published frame.
+    """
+    block: str
+    length: int
+    columns: Tuple[ColumnLayout, ...]
+
+
+def encode_column(series: pd.Series) -> Tuple[np.ndarray, Optional[pd.Index]]:
+    """
+    Turn a column into a fixed width array.
+
+    Args:
+        series (pd.Series): Column to encode
+
+    Returns:
+        Tuple[np.ndarray, Optional[pd.Index]]: (values or category codes, categories or None for values)
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.cat.categories
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufcmM':
+        return series.to_numpy(), None
+    try:
+        categorical = pd.Categorical(series)
+    except TypeError as e:
+        raise TypeError(f"Column '{series.name}' holds values that cannot be coded: {e}")
+    return categorical.codes, categorical.categories
+
+
+class SharedFrame:
+    """
+    A frame whose columns live in one shared memory block.
+
+    The publishing process owns the block and unlinks it on close; attaching
+    processes only map it. Attached columns are read-only views of the block,
+    categorical and text columns come back as categoricals.
+    """
+
+    def __init__(self, memory: shared_memory.SharedMemory, handle: FrameHandle, owner: bool):
+        self._memory = memory
+        self.handle = handle
+        self._owner = owner
+
+    @classmethod
+    def publish(cls, df: pd.DataFrame, index: bool = False) -> 'SharedFrame':
+        """
+        Copy a frame into a new shared memory block.
+
+        Args:
+            df (pd.DataFrame): Frame to publish
+            index (bool): Also publish the index, restored by frame()
+
+        Returns:
+            SharedFrame: Owner of the block
+        """
+        columns = {name: df[name] for name in df.columns}
+        if index:
+            columns[INDEX_COLUMN] = pd.Series(df.index, name=INDEX_COLUMN)
+
+        arrays = []
+        layout = []
+        offset = 0
+        for name, series in columns.items():
+            values, categories = encode_column(series)
+            values = np.ascontiguousarray(values)
+            # Keep every column aligned for its dtype
+            offset = -(-offset // 8) * 8
+            layout.append(ColumnLayout(name, values.dtype.str, offset, categories))
+            arrays.append(values)
+            offset += values.nbytes
+
+        memory = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for column, values in zip(layout, arrays):
+            np.ndarray(values.shape, dtype=values.dtype, buffer=memory.buf, offset=column.offset)[:] = values
+        return cls(memory, FrameHandle(memory.name, len(df), tuple(layout)), owner=True)
+
+    @classmethod
+    def attach(cls, handle: FrameHandle) -> 'SharedFrame':
+        """
+        Map a published block, once per process.
+
+        Args:
+            handle (FrameHandle): Handle of the published frame
+
+        Returns:
+            SharedFrame: Attached frame, closed when the process exits
+        """
+        attached = _ATTACHED.get(handle.block)
+        if attached is None:
+            attached = cls(shared_memory.SharedMemory(name=handle.block), handle, owner=False)
+            _ATTACHED[handle.block] = attached
+        return attached
+
+    def array(self, name: str) -> np.ndarray:
+        """
+        Read-only view of a column's values or codes.
+        """
+        column = next(column for column in self.handle.columns if column.name == name)
+        values = np.ndarray((self.handle.length,), dtype=np.dtype(column.dtype),
+                            buffer=self._memory.buf, offset=column.offset)
+        values.flags.writeable = False
+        return values
+
+    def frame(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Frame over the shared columns without copying them.
+
+        Args:
+            columns (Optional[List[str]]): Columns to include, all by default
+
+        Returns:
+            pd.DataFrame: Frame whose columns view the block
+        """
+        data = {}
+        index = None
+        for column in self.handle.columns:
+            if columns is not None and column.name not in columns and column.name != INDEX_COLUMN:
+                continue
+            values = self.array(column.name)
+            if column.categories is not None:
+                values = pd.Categorical.from_codes(
+                    values, dtype=pd.CategoricalDtype(column.categories), validate=False)
+            if column.name == INDEX_COLUMN:
+                index = pd.Index(values)
+            else:
+                data[column.name] = values
+        return pd.DataFrame(data, index=index, copy=False)
+
+    def shard_mask(self, shard: int, shards: int, key: str = 'Query ID') -> np.ndarray:
+        """
+        Rows whose key falls in a shard.
+
+        The shard of a value is a stable hash of its text, so frames coded with
+        different categories agree on the shard of every query.
+
+        Args:
+            shard (int): Shard number
+            shards (int): Number of shards
+            key (str): Column to shard on
+
+        Returns:
+            np.ndarray: Boolean row mask
+        """
+        categories = next(column.categories for column in self.handle.columns if column.name == key)
+        category_shards = np.array([zlib.crc32(str(value).encode()) % shards for value in categories],
+                                   dtype=np.int64)
+        codes = self.array(key)
+        return (codes >= 0) & (category_shards[np.clip(codes, 0, None)] == shard)
+
+    def close(self):
+        """
+        Unmap the block, and free it when this process published it.
+        """
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+
+    def __enter__(self) -> 'SharedFrame':
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+def first_rows(query_ids: pd.Series, rows: np.ndarray) -> pd.Series:
+    """
+    Row of the published frame where each query first appears.
+
+    Args:
+        query_ids (pd.Series): Query IDs of the selected rows
+        rows (np.ndarray): Ascending positions of the selected rows in the published frame
+
+    Returns:
+        pd.Series: First row keyed by Query ID
+    """
+    ids = pd.Index(query_ids.astype(object).to_numpy())
+    return pd.Series(rows, index=ids)[~ids.duplicated()]
+
+
+def review_transform_shard(review: FrameHandle, assignments: FrameHandle, sme_ready: pd.DataFrame,
+                           shard: int, shards: int) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Run the review status and transform stages on one shard of the queries, in a worker process.
+
+    The review status and transformed frames carry POSITION_COLUMN: reviewed
+    queries by their first row in the reviewed ratings, incomplete ones after
+    them by their first row in the assignments.
+
+    Args:
+        review (FrameHandle): Published reviewed ratings with the index
+        assignments (FrameHandle): Published ASSIGNMENT_COLUMNS of cleaned_feedback
+        sme_ready (pd.DataFrame): SMEs ready for evaluation
+        shard (int): Shard number
+        shards (int): Number of shards
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]: review status, data and transformed frames of the shard
+    """
+    review_frame = SharedFrame.attach(review)
+    assignment_frame = SharedFrame.attach(assignments)
+    review_rows = np.flatnonzero(review_frame.shard_mask(shard, shards))
+    assignment_rows = np.flatnonzero(assignment_frame.shard_mask(shard, shards))
+    shard_review = review_frame.frame().iloc[review_rows]
+    shard_assignments = assignment_frame.frame().iloc[assignment_rows]
+
+    review_status, data = process_query.get_review_status(shard_review, sme_ready, shard_assignments)
+    if review_status is None:
+        raise RuntimeError(f"Review status failed for shard {shard}")
+    transformed = generate_datafiles.generate_transformed_file(data, review_status)
+    if transformed is None:
+        raise RuntimeError(f"Transformation failed for shard {shard}")
+
+    query_ids = review_status['Query ID'].astype(object)
+    reviewed = query_ids.map(first_rows(shard_review['Query ID'], review_rows))
+    incomplete = query_ids.map(first_rows(shard_assignments['Query ID'], assignment_rows)) + review.length
+    positions = reviewed.where(review_status['Review status'] != 'incomplete', incomplete)
+    review_status[POSITION_COLUMN] = positions.to_numpy()
+    if not transformed.empty:
+        transformed[POSITION_COLUMN] = transformed['Query ID'].astype(object).map(
+            pd.Series(positions.to_numpy(), index=query_ids.to_numpy())).to_numpy()
+    return review_status, data, transformed
+
+
+def merge_shards(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenate shard frames in POSITION_COLUMN order and drop the column.
+    """
+    merged = pd.concat(frames, ignore_index=True)
+    if POSITION_COLUMN not in merged:
+        return merged
+    return merged.sort_values(POSITION_COLUMN, kind='stable', ignore_index=True).drop(columns=POSITION_COLUMN)
+
+
+def sharded_review_transform(review: pd.DataFrame, cleaned_feedback: pd.DataFrame, sme_ready: pd.DataFrame,
+                             workers: int) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Compute the review status and transformed file with the queries sharded over worker processes.
+
+    The reviewed ratings and the assignment columns are published once and
+    every worker attaches to them. The frames hold the same rows as from
+    get_review_status and generate_transformed_file; reviewed queries come
+    first in the order they first appear in review, then the incomplete ones
+    in the order they first appear in cleaned_feedback.
+
+    Args:
+        review (pd.DataFrame): Reviewed ratings from convert_feedback
+        cleaned_feedback (pd.DataFrame): Cleaned feedback with the assignments
+        sme_ready (pd.DataFrame): SMEs ready for evaluation
+        workers (int): Number of worker processes and shards
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]: (review status, data, transformed)
+    """
+    review = review[['SME', 'Query ID'] + feedback_data.DIMENSION_COLUMNS]
+    with SharedFrame.publish(review, index=True) as review_frame, \
+            SharedFrame.publish(cleaned_feedback[ASSIGNMENT_COLUMNS]) as assignment_frame:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(review_transform_shard, review_frame.handle, assignment_frame.handle,
+                                sme_ready, shard, workers)
+                for shard in range(workers)
+            ]
+            results = [future.result() for future in futures]
+    logging.info('Computed review status in %d shards', workers)
+
+    review_status = merge_shards([status for status, _, _ in results])
+    data = pd.concat([data for _, data, _ in results]).sort_index()
+    transformed = merge_shards([transformed for _, _, transformed in results])
+    return review_status, data, transformed
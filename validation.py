@@ -0,0 +1,215 @@
+"""
+validation.py
+
+This module validates the ingested feedback before the heavy stages run, so a
+renamed column or a stray value in one SME workbook stops the run up front
+instead of failing deep inside a stage. It checks that every workbook has a
+Feedback sheet with the required columns and an SME code in its name, that
+every rating is in the vocabulary its dimension converts to, that no
+(Query ID, SME) pair occurs twice and that every SME is in the SME master.
+
+Value checks run once per distinct value through the categorical codes and
+row checks are column operations, so the pass costs about as much as one
+filter of the feedback. All issues are collected and reported together.
+
+Dependencies:
+    - pandas
+    - numpy
+"""
+
+# Third-party library
+import pandas as pd
+import numpy as np
+
+# Built-in library
+import os
+import logging
+from typing import Callable, List, Optional, Set
+
+# Custom/User-defined module
+import feedback_data
+import dtype_policy
+
+REQUIRED_COLUMNS = ['Query ID', 'Unable to Review'] + feedback_data.DIMENSION_COLUMNS
+
+# Scores each dimension converts to, as reported in stats.xlsx
+SCORE_VALUES = {
+    'Overall Answer Helpfulness': ['0', '1', '2'],
+    'Comprehension': ['0', '1', '2'],
+    'Correctness': ['0', '1', '2', '3', '4', 'na'],
+    'Completeness': ['0', '1', '2', 'na'],
+    'Clinical Harmfulness': ['0', '1'],
+    'Clinical Harmfulness Level': ['0', '1', '2', '3', '4', 'na']
+}
+
+UNABLE_VALUES = ['X']
+
+CONSENSUS_SME = 'EVAL-consensus'
+
+ISSUE_COLUMNS = ['File', 'Query ID', 'SME', 'Column', 'Value', 'Issue']
+
+
+def load_sme_codes(input_directory: str) -> Set[str]:
+    """
+    Load the SME codes of the SME master list, ready or not.
+
+    Args:
+        input_directory (str): Directory containing sme_jira_master.xlsx
+
+    Returns:
+        Set[str]: SME codes (EVAL-xxx) plus the consensus reviewer
+    """
+    smes = pd.read_excel(os.path.join(input_directory, 'sme_jira_master.xlsx'), usecols=['ID'])
+    return set(smes['ID'].dropna().astype(str).str.strip()) | {CONSENSUS_SME}
+
+
+def is_missing(value) -> bool:
+    """
+    Check whether a cell is blank, blanks are allowed in every rating column.
+    """
+    return value is None or (isinstance(value, float) and np.isnan(value)) or str(value).strip() == ''
+
+
+def value_check(column: str) -> Callable:
+    """
+    Build the check of one raw cell value of a rating column.
+
+    Args:
+        column (str): Feedback column
+
+    Returns:
+        Callable: Function returning True for allowed raw values
+    """
+    if column == 'Unable to Review':
+        return lambda value: is_missing(value) or value in UNABLE_VALUES
+
+    if column == 'Overall Answer Helpfulness':
+        convert = lambda value: feedback_data.OVERALL_EMOJI_MAP.get(value, value)
+    else:
+        convert = feedback_data.dimension_index
+    allowed = set(SCORE_VALUES[column])
+
+    def check(value) -> bool:
+        if is_missing(value):
+            return True
+        try:
+            return str(convert(value)) in allowed
+        except (AttributeError, TypeError):
+            return False
+    return check
+
+
+def row_sources(feedback: pd.DataFrame, sources: Optional[List[feedback_data.WorkbookSource]]) -> np.ndarray:
+    """
+    Workbook path of every feedback row.
+
+    Args:
+        feedback (pd.DataFrame): Raw feedback
+        sources (Optional[List[WorkbookSource]]): Sources filled by load_raw_feedback
+
+    Returns:
+        np.ndarray: Path per row, empty strings when the sources do not cover the rows
+    """
+    if not sources or sum(source.rows for source in sources) != len(feedback):
+        return np.full(len(feedback), '', dtype=object)
+    return np.repeat(np.array([source.path for source in sources], dtype=object),
+                     [source.rows for source in sources])
+
+
+def workbook_issues(sources: List[feedback_data.WorkbookSource]) -> List[list]:
+    """
+    Check the sheets, columns and SME code of every workbook.
+
+    Args:
+        sources (List[WorkbookSource]): Sources filled by load_raw_feedback
+
+    Returns:
+        List[list]: Issue rows in ISSUE_COLUMNS order
+    """
+    issues = []
+    for source in sources:
+        sme = feedback_data.extract_sme_code(source.path)
+        if sme is None:
+            issues.append([source.path, None, None, None, os.path.basename(source.path),
+                           'no SME code (EVAL-xxx) in the file name'])
+        if not source.has_sheet:
+            issues.append([source.path, None, sme, None, None, 'no Feedback sheet'])
+        elif source.columns is not None:
+            for column in REQUIRED_COLUMNS:
+                if column not in source.columns:
+                    issues.append([source.path, None, sme, column, None, 'missing required column'])
+    return issues
+
+
+def validate_feedback(feedback: pd.DataFrame, sme_codes: Set[str],
+                      sources: Optional[List[feedback_data.WorkbookSource]] = None) -> pd.DataFrame:
+    """
+    Validate the raw feedback as returned by load_raw_feedback.
+
+    Args:
+        feedback (pd.DataFrame): Raw feedback
+        sme_codes (Set[str]): Known SME codes from load_sme_codes
+        sources (Optional[List[WorkbookSource]]): Sources filled by load_raw_feedback, needed for the
+            workbook checks and to name the file of each row
+
+    Returns:
+        pd.DataFrame: One row per issue in ISSUE_COLUMNS, empty when the feedback is valid
+    """
+    issues = [pd.DataFrame(workbook_issues(sources or []), columns=ISSUE_COLUMNS)]
+    if feedback.empty or 'Query ID' not in feedback or 'SME' not in feedback:
+        return pd.concat(issues, ignore_index=True)
+
+    files = row_sources(feedback, sources)
+    query_ids = feedback['Query ID'].astype(object).to_numpy()
+    smes = feedback['SME'].astype(object).to_numpy()
+
+    def row_issues(mask: np.ndarray, column: Optional[str], values, issue: str) -> pd.DataFrame:
+        mask = np.asarray(mask, dtype=bool)
+        return pd.DataFrame({
+            'File': files[mask],
+            'Query ID': query_ids[mask],
+            'SME': smes[mask],
+            'Column': column,
+            'Value': np.asarray(values, dtype=object)[mask] if values is not None else None,
+            'Issue': issue
+        }, columns=ISSUE_COLUMNS)
+
+    # Allowed values, checked once per distinct value
+    for column in ['Unable to Review'] + feedback_data.DIMENSION_COLUMNS:
+        if column not in feedback:
+            continue
+        valid = dtype_policy.map_values(feedback[column], value_check(column)).astype(bool).to_numpy()
+        if not valid.all():
+            issues.append(row_issues(~valid, column, feedback[column].astype(object).to_numpy(),
+                                     'value outside the score vocabulary'))
+
+    duplicated = feedback.duplicated(subset=['Query ID', 'SME'], keep=False).to_numpy()
+    if duplicated.any():
+        issues.append(row_issues(duplicated, 'Query ID', query_ids, 'duplicate (Query ID, SME) rating'))
+
+    known = feedback['SME'].astype(object).isin(sme_codes).to_numpy()
+    unknown = ~known & feedback['SME'].notna().to_numpy()
+    if unknown.any():
+        issues.append(row_issues(unknown, 'SME', smes, 'SME code not in the SME master list'))
+
+    return pd.concat(issues, ignore_index=True)
+
+
+def report_issues(issues: pd.DataFrame, out_file: Optional[str] = None):
+    """
+    Log the issues grouped by file and optionally write them to Excel.
+
+    Args:
+        issues (pd.DataFrame): Issues from validate_feedback
+        out_file (Optional[str]): Excel file to write all issues to
+    """
+    logging.error('Feedback validation found %d issues in %d files', len(issues), issues['File'].nunique())
+    for (file, issue, column), rows in issues.groupby(['File', 'Issue', 'Column'], dropna=False, sort=False):
+        queries = [str(query) for query in rows['Query ID'].dropna().head(10)]
+        more = f' and {len(rows) - len(queries)} more' if len(rows) > len(queries) and queries else ''
+        rows_found = f' ({len(rows)} rows): {", ".join(queries)}{more}' if queries else ''
+        logging.error('%s: %s%s%s', file or '<unknown file>', issue,
+                      f' in {column}' if isinstance(column, str) else '', rows_found)
+    if out_file:
+        issues.to_excel(out_file, index=False)
+        logging.error('All validation issues written to %s', out_file)